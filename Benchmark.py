@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Headless benchmarks for the hot paths of the desktop: config parsing, word wrapping, the grid layout math, shortcut
+search and icon loading. Nothing here needs a display. Results are written as JSON so that runs can be compared."""
+from PIL import Image
+from contextlib import suppress
+from typing import *
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import Cache
+import Config
+import Global
+import PIL
+import Search
+settings = """    <settings>
+        <resolution>3200x1680</resolution>
+        <wallpaper>./Images/Default_Wallpaper.jpg</wallpaper>
+        <button_length>200</button_length>
+        <cell_margin>20</cell_margin>
+        <internal_padding>10</internal_padding>
+        <shortcut_font-size>10</shortcut_font-size>
+        <context_font-size>12</context_font-size>
+    </settings>
+"""
+words = ["Terminal", "Editor", "Browser", "Files", "Calculator", "System", "Monitor", "Music", "Player", "Settings",
+         "Notes", "Mail", "Calendar", "Photos", "Backup", "Disk", "Network", "Archive", "Manager", "Viewer", "计算器",
+         "终端", "Supercalifragilisticexpialidocious"]
+
+
+class StandInFont:
+    """Deterministic replacement for tkinter.font.Font, so that word wrapping can be timed without a Tk interpreter.
+    Each character is as wide as a fixed function of its code point."""
+    def __init__(self, size: int = 10):
+        self.size = size
+
+    def measure(self, text: str) -> int:
+        return sum(self.size // 2 + ord(char) % 5 if ord(char) < 0x2e80 else self.size + 2 for char in text)
+
+    def metrics(self, name: str) -> int:
+        return self.size + 4
+
+    def actual(self) -> Dict[str, Union[str, int]]:
+        return {"family": "stand-in", "size": self.size}
+
+
+def make_labels(count: int, seed: int = 0) -> List[str]:
+    generator = random.Random(seed)
+    return [" ".join(generator.choice(words) for _ in range(generator.randint(1, 4))) + " {}".format(index)
+            for index in range(count)]
+
+
+def write_config(path: str, count: int, icon_path: str) -> None:
+    button = '        <button label_text="{}" icon_path="{}">echo {}</button>\n'
+    buttons = "".join(button.format(label, icon_path, index) for index, label in enumerate(make_labels(count)))
+    with open(path, "w", encoding="utf-8") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8" ?>\n<desktop>\n{}    <shortcuts>\n{}    </shortcuts>\n'
+                   '</desktop>\n'.format(settings, buttons))
+
+
+def time_call(function: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def record(results: List[Dict[str, Any]], name: str, size: int, timings: List[float]) -> None:
+    results.append({"name": name, "size": size, "repeat": len(timings), "min_s": min(timings),
+                    "median_s": statistics.median(timings), "mean_s": statistics.fmean(timings)})
+    print("{:<32} {:>6} {:>12.3f} ms".format(name, size, statistics.median(timings) * 1000), file=sys.stderr)
+
+
+def bench_config(results: List[Dict[str, Any]], work_dir: str, sizes: List[int], repeat: int) -> None:
+    for size in sizes:
+        config_path = os.path.join(work_dir, "config_{}.xml".format(size))
+
+        def make_storage() -> Config.Storage:
+            storage = Config.Storage(os.path.join(work_dir, "main.pyw"), config_path)
+            # Keeps the snapshot out of the user's ~/.desktop_shortcuts.
+            storage.state_dir = work_dir
+            storage.snapshot_path = os.path.join(work_dir, "config_{}.snapshot".format(size))
+            return storage
+
+        storage = make_storage()
+        write_config(config_path, size, "./Images/Default_Icon.png")
+        # Snapshots of a file modified less than Config.mtime_tolerance before they were written are verified by
+        # hashing the file, so the file is backdated for the snapshot benchmark to time the path of a normal start.
+        backdated = time.time_ns() - 2 * int(Config.mtime_tolerance)
+        os.utime(config_path, ns=(backdated, backdated))
+
+        def cold_parse() -> None:
+            storage.shortcut_data = storage.content_hash = None
+            with suppress(OSError):
+                os.remove(storage.snapshot_path)
+            storage.init_xml_data()
+
+        record(results, "config.init_xml_data", size, time_call(cold_parse, repeat))
+        record(results, "config.init_xml_data.snapshot", size,
+               time_call(lambda: make_storage().init_xml_data(), repeat))
+        record(results, "config.init_xml_data.unchanged", size, time_call(storage.init_xml_data, repeat))
+        record(results, "config.get_settings", size, time_call(storage.get_settings, repeat))
+
+
+def bench_wrapping(results: List[Dict[str, Any]], sizes: List[int], repeat: int) -> None:
+    font = StandInFont()
+    for size in sizes:
+        labels = make_labels(size)
+
+        def wrap() -> None:
+            for label in labels:
+                Global.word_wrap_text(label, 180, font)
+
+        def clear_caches() -> None:
+            Global.text_layout.font_keys.clear()
+            Global.text_layout.glyph_widths.clear()
+            Global.text_layout.wrapped.clear()
+
+        Global.text_layout.cache_size = max(Global.text_layout.cache_size, size)
+        record(results, "global.word_wrap_text.cold", size, time_call(wrap, repeat, setup=clear_caches))
+        record(results, "global.word_wrap_text.memoized", size, time_call(wrap, repeat))
+
+
+def bench_layout(results: List[Dict[str, Any]], sizes: List[int], repeat: int) -> None:
+    generator = random.Random(0)
+    record(results, "global.resize_image", 10000,
+           time_call(lambda: [Global.resize_image((generator.randint(1, 4000), generator.randint(1, 4000)), (180, 180))
+                              for _ in range(10000)], repeat))
+    for size in sizes:
+        points = [(generator.randint(0, 3200), generator.randint(0, 1680)) for _ in range(10000)]
+
+        def layout() -> None:
+            grid = Global.GridLayout(size, 1680, 200, 20, 10, 42)
+            for index in range(size):
+                grid.cell_box(index)
+
+        def hit_test() -> None:
+            grid = Global.GridLayout(size, 1680, 200, 20, 10, 42)
+            for x, y in points:
+                grid.index_at(x, y)
+
+        record(results, "global.grid_layout", size, time_call(layout, repeat))
+        record(results, "global.grid_layout.index_at_x10000", size, time_call(hit_test, repeat))
+
+
+def bench_search(results: List[Dict[str, Any]], sizes: List[int], repeat: int) -> None:
+    for size in sizes:
+        shortcuts = tuple(Config.Shortcut(label, "./Images/Default_Icon.png", "echo {}".format(index))
+                          for index, label in enumerate(make_labels(size)))
+        record(results, "search.index", size, time_call(lambda: Search.SearchIndex(shortcuts), repeat))
+        index = Search.SearchIndex(shortcuts)
+        queries = ["t", "te", "ter", "term", "termi", "termin", "terminal", "terminal 1"]
+        record(results, "search.keystrokes_x{}".format(len(queries)), size,
+               time_call(lambda: [index.search(query) for query in queries], repeat))
+
+
+def bench_icons(results: List[Dict[str, Any]], work_dir: str, repeat: int) -> None:
+    box = (180, 180)
+    for side, extension in ((256, "png"), (1024, "png"), (2048, "jpg")):
+        path = os.path.join(work_dir, "icon_{}.{}".format(side, extension))
+        Image.effect_noise((side, side), 64).convert("RGB").save(path)
+        record(results, "cache.decode_image.{}".format(extension), side,
+               time_call(lambda: Cache.decode_image(path, box), repeat))
+        cache = Cache.ThumbnailCache(os.path.join(work_dir, "thumbnails_{}".format(side)))
+        cache.load(path, box)
+        record(results, "cache.thumbnail_cache.warm.{}".format(extension), side,
+               time_call(lambda: cache.load(path, box), repeat))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                        help="numbers of <button> entries to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    parser.add_argument("--output", help="file to write the JSON results to (default: stdout)")
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench_config(results, work_dir, args.sizes, args.repeat)
+        bench_wrapping(results, args.sizes, args.repeat)
+        bench_layout(results, args.sizes, args.repeat)
+        bench_search(results, args.sizes, args.repeat)
+        bench_icons(results, work_dir, args.repeat)
+    report = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                       "pillow": PIL.__version__, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
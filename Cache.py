@@ -0,0 +1,228 @@
+from PIL import Image, ImageTk, UnidentifiedImageError
+from collections import OrderedDict
+from contextlib import suppress
+from typing import *
+import Global
+import hashlib
+import os
+import struct
+import threading
+# Magic, source mtime (ns), source size, width, height, mode (padded to 4 bytes).
+header_format = struct.Struct("<4sqqII4s")
+header_magic = b"DSTC"
+# Modes of images that have an alpha channel.
+alpha_modes = ("RGBA", "RGBa", "LA", "La", "PA")
+
+
+def decode_image(path: str, box: Tuple[int, int], mode: Optional[str] = "RGBA") -> Image.Image:
+    """Opens the image at the given path and scales it to fit in the given box. If mode is None, the image is returned
+    as RGBA if it has any transparency and as RGB otherwise. Raises OSError or UnidentifiedImageError if the file is
+    missing or not a supported image."""
+    image = Image.open(path)
+    if mode is None:
+        mode = "RGBA" if image.mode in alpha_modes or "transparency" in image.info else "RGB"
+    # JPEGs are decoded straight at the smallest DCT scale that is still at least as large as the box, and other
+    # formats are shrunk with a cheap integer reduce() before the final resample.
+    image.draft("RGB", box)
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        image = image.convert(mode)  # Palette and bitmap images can only be resampled after conversion.
+    image = image.resize(Global.resize_image(image.size, box), reducing_gap=3.0)
+    return image.convert(mode) if image.mode != mode else image
+
+
+def write_flattened(path: str, wallpaper: Image.Image, resolution: Tuple[int, int],
+                    icons: List[Tuple[Image.Image, Tuple[int, int]]]) -> bool:
+    """Draws the wallpaper centred on a black background of the given size with the icons on top, the same way the
+    canvas does, and saves the result as a PNG. A bool is returned to indicate if the file was written."""
+    flattened = Image.new("RGB", resolution, "black")
+    position = (resolution[0] // 2 - wallpaper.width // 2, resolution[1] // 2 - wallpaper.height // 2)
+    flattened.paste(wallpaper, position, wallpaper if wallpaper.mode == "RGBA" else None)
+    for icon, position in icons:
+        flattened.paste(icon, position, icon if icon.mode == "RGBA" else None)
+    temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        flattened.save(temp_path, "PNG", compress_level=1)  # Loading speed matters more than size here.
+        os.replace(temp_path, path)
+    except OSError:
+        with suppress(OSError):
+            os.remove(temp_path)
+        return False
+    else:
+        return True
+
+
+class ThumbnailCache:
+    """On-disk cache of pre-scaled images stored as raw pixel data, so that a cache hit does not need to decode
+    anything. Entries are keyed by the source path and the target box, and store the mtime and size of the source
+    they were made from, so an entry is rebuilt automatically when its source changes. The total size of the cache
+    is capped, and the least recently used entries are evicted first."""
+    def __init__(self, cache_dir: str, size_limit: int = 64 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        self.total_size: Optional[int] = None  # Unknown until the first write scans the directory.
+        self.lock = threading.Lock()
+
+    def entry_path(self, source_path: str, box: Tuple[int, int], mode: Optional[str]) -> str:
+        key = "{}\0{}x{}\0{}".format(source_path, box[0], box[1], mode or "auto").encode("utf-8", "surrogatepass")
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest() + ".thumb")
+
+    def load(self, path: str, box: Tuple[int, int], mode: Optional[str] = "RGBA") -> Optional[Image.Image]:
+        """Returns the image at the given path scaled to fit in the given box, or None if the image could not be
+        loaded. If mode is None, the image is RGB unless the source has transparency (see decode_image())."""
+        path = os.path.abspath(path)
+        try:
+            source_stat = os.stat(path)
+        except OSError:
+            return None
+        entry_path = self.entry_path(path, box, mode)
+        image = self.read_entry(entry_path, source_stat, mode)
+        if image is None:
+            try:
+                image = decode_image(path, box, mode)
+            except (OSError, UnidentifiedImageError, ValueError):
+                return None
+            self.write_entry(entry_path, source_stat, image)
+        return image
+
+    def read_entry(self, entry_path: str, source_stat: os.stat_result, mode: Optional[str]) -> Optional[Image.Image]:
+        try:
+            with open(entry_path, "rb") as file:
+                header = file.read(header_format.size)
+                magic, mtime, size, width, height, entry_mode = header_format.unpack(header)
+                entry_mode = entry_mode.rstrip(b"\0").decode("ascii")
+                if (magic != header_magic or mtime != source_stat.st_mtime_ns or size != source_stat.st_size
+                        or entry_mode != (mode or entry_mode)):
+                    return None  # The source has changed since this entry was written; it will be overwritten.
+                data = file.read()
+            image = Image.frombytes(entry_mode, (width, height), data)
+            os.utime(entry_path)  # The entry's own mtime tracks when it was last used, for LRU eviction.
+        except (OSError, struct.error, ValueError):
+            return None
+        else:
+            return image
+
+    def write_entry(self, entry_path: str, source_stat: os.stat_result, image: Image.Image) -> None:
+        data = image.tobytes()
+        header = header_format.pack(header_magic, source_stat.st_mtime_ns, source_stat.st_size, image.width,
+                                    image.height, image.mode.encode("ascii"))
+        temp_path = "{}.{}.tmp".format(entry_path, threading.get_ident())
+        with self.lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                old_size = os.path.getsize(entry_path) if os.path.isfile(entry_path) else 0
+                with open(temp_path, "wb") as file:
+                    file.write(header)
+                    file.write(data)
+                os.replace(temp_path, entry_path)
+            except OSError:
+                with suppress(OSError):
+                    os.remove(temp_path)
+                return  # The cache is only an optimization, so failing to write to it is not an error.
+            if self.total_size is None:
+                self.total_size = self.scan()[1]
+            else:
+                self.total_size += len(header) + len(data) - old_size
+            if self.total_size > self.size_limit:
+                self.evict()
+
+    def scan(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        """Returns the (last used time, size, path) of every entry, and the total size of all entries."""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as iterator:
+                for item in iterator:
+                    if item.name.endswith(".thumb"):
+                        with suppress(OSError):
+                            stat = item.stat()
+                            entries.append((stat.st_mtime, stat.st_size, item.path))
+        except OSError:
+            pass
+        return entries, sum(entry[1] for entry in entries)
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in its size limit. Must be called with the
+        lock held."""
+        entries, self.total_size = self.scan()
+        for last_used, size, path in sorted(entries):
+            if self.total_size <= self.size_limit:
+                break
+            with suppress(OSError):
+                os.remove(path)
+                self.total_size -= size
+
+
+class IconEntry:
+    __slots__ = ("image", "photo", "size", "users")
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self.photo = ImageTk.PhotoImage(image)
+        self.size = image.width * image.height * (4 + len(image.getbands()))  # Tk stores 4 bytes per pixel.
+        self.users = 0
+
+
+class IconPool:
+    """In-memory pool of scaled icons, shared by every shortcut that shows the same icon at the same size. Each entry
+    holds the decoded image and its Tk image, keyed by the icon's resolved path, mtime, size and target box, so an entry
+    outlives refreshes for as long as its source file is unchanged. Entries are reference counted by the shortcuts that
+    display them, and once the pool grows past its memory limit, the least recently used entries that are not displayed
+    are evicted. Must only be used from the Tk thread."""
+    def __init__(self, memory_limit: int = 64 * 1024 ** 2):
+        self.memory_limit = memory_limit
+        self.entries: "OrderedDict[tuple, IconEntry]" = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, key: tuple) -> Optional[ImageTk.PhotoImage]:
+        """Returns the Tk image with the given key and counts one more user of it, or None if it is not in the pool."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        entry.users += 1
+        self.hits += 1
+        return entry.photo
+
+    def image(self, key: tuple) -> Optional[Image.Image]:
+        """Returns the decoded image with the given key, without counting a use of it."""
+        entry = self.entries.get(key)
+        return None if entry is None else entry.image
+
+    def add(self, key: tuple, image: Image.Image, users: int = 1) -> ImageTk.PhotoImage:
+        """Adds a freshly decoded image to the pool and returns its Tk image, already counting the given number of users
+        of it (the ones whose miss caused the decode). If another desktop has added the same image in the meantime, its
+        entry is used instead. Call trim() afterwards."""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = IconEntry(image)
+            self.resident_bytes += entry.size
+        else:
+            self.entries.move_to_end(key)
+        entry.users += users
+        return entry.photo
+
+    def release(self, key: tuple) -> None:
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.users -= 1
+            if entry.users <= 0 and self.resident_bytes > self.memory_limit:
+                self.trim()
+
+    def trim(self) -> None:
+        """Evicts the least recently used entries without users until the pool fits in its memory limit."""
+        if self.resident_bytes <= self.memory_limit:
+            return
+        for key in [key for key, entry in self.entries.items() if entry.users <= 0]:
+            if self.resident_bytes <= self.memory_limit:
+                break
+            self.resident_bytes -= self.entries.pop(key).size
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "resident_bytes": self.resident_bytes}
+
+
+icon_pool = IconPool()
@@ -1,18 +1,116 @@
-from collections import namedtuple
+from contextlib import suppress
 from xml.etree import ElementTree
 from typing import *
+import hashlib
+import io
+import marshal
 import os
-shortcuts = namedtuple("shortcuts", "label_text, icon_path, command")
+import sys
+import time
+# Bumped whenever the layout of the snapshot changes. The snapshot is marshalled, so it is also tied to the interpreter.
+snapshot_format = "desktop_shortcuts-snapshot:2:{}:{}\n".format(sys.implementation.cache_tag, marshal.version).encode()
+# A file modified this close to the time the snapshot was written may have been modified again within the resolution of
+# its mtime, so its content is hashed instead of trusting the mtime.
+mtime_tolerance = 2 * 10 ** 9
+
+
+def expand_path(path: str) -> str:
+    return os.path.abspath(os.path.expandvars(os.path.expanduser(os.path.normpath(path))))
+
+
+class Shortcut:
+    """A single <button>. icon_file is the normalized, absolute path of the icon, and actions are the (label, command)
+    pairs of its <action> children, which are added to the context menu when it is opened on the shortcut."""
+    __slots__ = ("label_text", "icon_path", "command", "actions", "icon_file")
+
+    def __init__(self, label_text: str, icon_path: str, command: Optional[str],
+                 actions: Tuple[Tuple[str, Optional[str]], ...] = (), icon_file: Optional[str] = None):
+        self.label_text = label_text
+        self.icon_path = icon_path
+        self.command = command
+        self.actions = actions
+        self.icon_file = expand_path(icon_path) if icon_file is None else icon_file
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Shortcut):
+            return NotImplemented
+        return (self.label_text, self.icon_path, self.command, self.actions) \
+            == (other.label_text, other.icon_path, other.command, other.actions)
+
+    def __hash__(self) -> int:
+        return hash((self.label_text, self.icon_path, self.command, self.actions))
+
+    def __repr__(self) -> str:
+        return "Shortcut(label_text={!r}, icon_path={!r}, command={!r}, actions={!r})".format(
+            self.label_text, self.icon_path, self.command, self.actions)
+
+
+class Settings:
+    """The validated contents of <settings>. Raises ValueError if a setting is malformed, or KeyError if a required
+    setting is missing."""
+    __slots__ = ("resolution", "position", "wallpaper_path", "button_length", "cell_margin", "internal_padding",
+                 "shortcut_font_size", "context_font_size", "launch_limit", "icon_memory", "profiling")
+
+    def __init__(self, values: Dict[str, Optional[str]]):
+        resolution = tuple(int(i) for i in self.required(values, "resolution").split("x"))
+        if len(resolution) != 2:
+            raise ValueError("resolution must be two numbers separated by 'x'")
+        self.resolution: Tuple[int, int] = resolution
+        position = tuple(int(i) for i in (values.get("position") or "0x0").split("x"))
+        if len(position) != 2:
+            raise ValueError("position must be two numbers separated by 'x'")
+        self.position: Tuple[int, int] = position
+        self.wallpaper_path = expand_path(self.required(values, "wallpaper"))
+        self.button_length = int(self.required(values, "button_length"))
+        self.cell_margin = int(self.required(values, "cell_margin"))
+        self.internal_padding = int(self.required(values, "internal_padding"))
+        self.shortcut_font_size = int(self.required(values, "shortcut_font-size"))
+        self.context_font_size = int(self.required(values, "context_font-size"))
+        self.launch_limit = int(values.get("launch_limit") or "4")
+        self.icon_memory = int(values.get("icon_memory") or "64")  # In MiB.
+        self.profiling = bool(int(values.get("profiling") or "0"))
+
+    @staticmethod
+    def required(values: Dict[str, Optional[str]], name: str) -> str:
+        value = values.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+
+MenuItems = Tuple[Tuple[str, Optional[str]], ...]
+ParsedConfig = Tuple[Dict[str, Optional[str]], Tuple[Shortcut, ...], MenuItems]
 
 
 class Storage:
-    def __init__(self, script_path: str):
+    def __init__(self, script_path: str, config_path: Optional[str] = None):
         self.root_dir = os.path.dirname(script_path)
         self.config_dir = os.path.expanduser(os.path.normpath("~/.desktop_shortcuts"))
         self.default_file = os.path.join(self.root_dir, os.path.normpath("Data/default.xml"))
         self.config_path = os.path.join(self.config_dir, "userconfig.xml")
+        if config_path is not None:
+            self.config_path = os.path.abspath(os.path.expanduser(config_path))
+        # The caches and logs are shared by all desktops, but everything else derived from a config file other than the
+        # default one is kept in its own folder.
+        self.state_dir = self.config_dir
+        if self.config_path != os.path.join(self.config_dir, "userconfig.xml"):
+            config_id = hashlib.sha1(self.config_path.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+            self.state_dir = os.path.join(self.config_dir, "desktops", config_id)
+        self.snapshot_path = os.path.join(self.state_dir, "userconfig.snapshot")
+        self.thumbnail_dir = os.path.join(self.config_dir, "thumbnails")
+        self.wallpaper_dir = os.path.join(self.config_dir, "wallpapers")
+        self.log_dir = os.path.join(self.config_dir, "logs")
+        self.profile_path = os.path.join(self.state_dir, "profile.json")
+        self.preview_path = os.path.join(self.state_dir, "preview.json")
+        self.preview_image_path = os.path.join(self.state_dir, "preview.png")
+        self.window_path = os.path.join(self.state_dir, "window.json")
         self.encoding = "utf-8"
-        self.element_tree: Optional[ElementTree.ElementTree] = None
+        self.settings_data: Dict[str, Optional[str]] = {}
+        self.shortcut_data: Optional[Tuple[Shortcut, ...]] = None
+        self.menu_data: MenuItems = ()
+        self.content_hash: Optional[str] = None
+        self.watched_hash: Optional[str] = None
+        self.prepared: Optional[Tuple[str, ParsedConfig]] = None
 
     def get_default_data(self) -> Optional[str]:
         try:
@@ -30,8 +128,7 @@ class Storage:
         if default_data is None:
             return False
         try:
-            if not os.path.isdir(self.config_dir):
-                os.mkdir(self.config_dir)
+            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
             with open(self.config_path, "w", encoding=self.encoding) as file:
                 file.write(default_data)
         except (OSError, NotImplementedError):
@@ -39,19 +136,163 @@ class Storage:
         else:
             return True
 
+    def read_config(self) -> Tuple[str, bytes]:
+        """Returns the hash and content of the config file. Raises OSError if the file could not be read."""
+        with open(self.config_path, "rb") as file:
+            data = file.read()
+        return hashlib.sha1(data).hexdigest(), data
+
     def init_xml_data(self) -> bool:
+        """Loads the config file, unless it has not changed since it was last loaded. On startup, the snapshot written
+        by the previous run is used instead if it was made from the same file. A bool is returned to indicate if the
+        config could be loaded."""
         if not os.path.isfile(self.config_path) and not self.init_files():
             return False  # Config files are missing, and the attempt to create them failed.
         try:
-            self.element_tree = ElementTree.parse(self.config_path)
+            stat = os.stat(self.config_path)  # Before reading, so that a write in between is caught by the next load.
+            if self.shortcut_data is None and self.load_snapshot(stat):
+                return True
+            content_hash, data = self.read_config()
+            if content_hash == self.content_hash and self.shortcut_data is not None:
+                return True  # The file has not changed since it was last parsed.
+            prepared = self.prepared
+            if prepared is not None and prepared[0] == content_hash:
+                parsed = prepared[1]  # Already parsed by the file watcher.
+            else:
+                parsed = self.parse_config(data)
         except (OSError, ElementTree.ParseError):
             return False
-        else:
-            return True
+        if parsed is None:
+            return False
+        self.settings_data, self.shortcut_data, self.menu_data = parsed
+        self.content_hash = self.watched_hash = content_hash
+        self.prepared = None
+        self.save_snapshot(stat)
+        return True
+
+    def detect_changes(self) -> bool:
+        """Called by the file watcher after the config file was written to. Returns whether the settings or shortcuts in
+        the file differ from the loaded ones. Files whose content did not change are not parsed at all, and files that
+        are not valid XML (e.g. half-saved) are ignored until they are saved again."""
+        try:
+            content_hash, data = self.read_config()
+        except OSError:
+            return False
+        if content_hash == self.watched_hash:
+            return False
+        self.watched_hash = content_hash
+        try:
+            parsed = self.parse_config(data)
+        except ElementTree.ParseError:
+            return False
+        if parsed is None:
+            return True  # Well-formed but invalid. Reloading it reports the problem.
+        if self.shortcut_data is not None and parsed == (self.settings_data, self.shortcut_data, self.menu_data):
+            return False
+        self.prepared = (content_hash, parsed)
+        return True
+
+    @staticmethod
+    def parse_config(data: bytes) -> Optional[ParsedConfig]:
+        """Returns the settings, shortcuts and context menu items in the given config file content, or None if a
+        <button>, <action> or <item> is missing an attribute or there is no <shortcuts> tag. The XML is streamed rather
+        than built into a tree, and every element is dropped as soon as it has been read, so that memory use does not
+        grow with the number of shortcuts. Raises ElementTree.ParseError if the content is not valid XML."""
+        settings: Dict[str, Optional[str]] = {}
+        shortcut_list: List[Shortcut] = []
+        menu_items: List[Tuple[str, Optional[str]]] = []
+        found_shortcuts = False
+        section: Optional[ElementTree.Element] = None  # The child of the root element that is being read.
+        depth = 0
+        for event, element in ElementTree.iterparse(io.BytesIO(data), events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2:
+                    section = element
+                continue
+            if depth == 3:
+                if section.tag == "settings":
+                    settings.setdefault(element.tag, element.text)
+                elif section.tag == "shortcuts" and not found_shortcuts:
+                    label_text = element.get("label_text")
+                    icon_path = element.get("icon_path")
+                    actions = tuple((action.get("label"), action.text) for action in element if action.tag == "action")
+                    if label_text is None or icon_path is None or any(label is None for label, _ in actions):
+                        return None
+                    shortcut_list.append(Shortcut(label_text, icon_path, element.text, actions))
+                elif section.tag == "context_menu":
+                    if element.get("label") is None:
+                        return None
+                    menu_items.append((element.get("label"), element.text))
+                del section[:]
+            elif depth == 2:
+                found_shortcuts = found_shortcuts or element.tag == "shortcuts"
+                element.clear()
+            depth -= 1
+        if not found_shortcuts:
+            return None
+        return settings, tuple(shortcut_list), tuple(menu_items)
+
+    def load_snapshot(self, stat: os.stat_result) -> bool:
+        """Loads the settings and shortcuts from the snapshot, if it was made from a config file with the same mtime and
+        size, or failing that the same content. A bool is returned to indicate if the snapshot could be used."""
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                if file.readline() != snapshot_format:
+                    return False
+                (cwd, home, mtime_ns, size, written_ns, content_hash, settings, fields,
+                 menu_items) = marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if cwd != os.getcwd() or home != os.path.expanduser("~"):
+            return False  # Relative paths would resolve differently.
+        verified = (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size) and written_ns - mtime_ns >= mtime_tolerance
+        if not verified:
+            try:
+                if self.read_config()[0] != content_hash:
+                    return False
+            except OSError:
+                return False
+        shortcut_list = []
+        for index in range(0, len(fields), 5):
+            label_text, icon_path, command, actions, icon_file = fields[index:index + 5]
+            if "$" in icon_path or "%" in icon_path:
+                icon_file = None  # Environment variables may have changed since the snapshot was written.
+            shortcut_list.append(Shortcut(label_text, icon_path, command, actions, icon_file))
+        self.settings_data = dict(settings)
+        self.shortcut_data = tuple(shortcut_list)
+        self.menu_data = menu_items
+        self.content_hash = self.watched_hash = content_hash
+        if not verified:
+            self.save_snapshot(stat)  # So that the next start can go by the mtime alone.
+        return True
+
+    def save_snapshot(self, stat: os.stat_result) -> None:
+        fields = []
+        for shortcut in self.shortcut_data:
+            fields.extend((shortcut.label_text, shortcut.icon_path, shortcut.command, shortcut.actions,
+                           shortcut.icon_file))
+        payload = (os.getcwd(), os.path.expanduser("~"), stat.st_mtime_ns, stat.st_size, time.time_ns(),
+                   self.content_hash, tuple(self.settings_data.items()), tuple(fields), self.menu_data)
+        temp_path = "{}.{}.tmp".format(self.snapshot_path, os.getpid())
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(temp_path, "wb") as file:
+                file.write(snapshot_format)
+                file.write(marshal.dumps(payload))
+            os.replace(temp_path, self.snapshot_path)
+        except OSError:
+            with suppress(OSError):
+                os.remove(temp_path)
+
+    def get_settings(self) -> Settings:
+        """Returns the validated settings. Raises ValueError if a setting is malformed, or KeyError if a required
+        setting is missing."""
+        return Settings(self.settings_data)
 
-    def get_setting(self, name: str) -> str:
-        return self.element_tree.find("./settings/{}".format(name)).text
+    def get_shortcut_data(self) -> Tuple[Shortcut, ...]:
+        return self.shortcut_data
 
-    def get_shortcut_data(self) -> Tuple[shortcuts, ...]:
-        return tuple(shortcuts(label_text=s.attrib["label_text"], icon_path=s.attrib["icon_path"], command=s.text)
-                     for s in self.element_tree.find("./shortcuts"))
+    def get_menu_data(self) -> MenuItems:
+        """Returns the (label, command) pairs of the <item> tags in <context_menu>."""
+        return self.menu_data
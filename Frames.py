@@ -1,26 +1,135 @@
-from PIL import Image, ImageTk, UnidentifiedImageError
+from PIL import ImageTk
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from typing import *
 import tkinter
 import tkinter.font
 import tkinter.messagebox as msg
+import Cache
 import Config
 import Global
+import Launcher
+import Preview
+import Profiler
+import Search
+import Watcher
+import math
 import os.path
-import subprocess
+import queue
+import threading
+import time
 if TYPE_CHECKING:
     import Window
 
 
+class Services:
+    """Everything that the desktops hosted by one process share: the icon and wallpaper caches, the threads that decode
+    icons and write previews, the scaled wallpapers, the fonts and the launcher."""
+    def __init__(self, app: "Window.Application", config: Config.Storage):
+        self.app = app
+        self.main_thread = app.main_thread
+        self.thumbnail_cache = Cache.ThumbnailCache(config.thumbnail_dir)
+        self.wallpaper_cache = Cache.ThumbnailCache(config.wallpaper_dir, size_limit=96 * 1024 ** 2)
+        self.icon_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="icon")
+        # A single thread, so that previews are written in order.
+        self.preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self.launcher = Launcher.Launcher(config.log_dir, self.launch_failed)
+        self.fonts: Dict[int, tkinter.font.Font] = {}
+        self.decoding: Dict[Optional[tuple], List[queue.Queue]] = {}  # The queues waiting for each icon being decoded.
+        self.decoding_lock = threading.Lock()
+        self.wallpapers: Dict[Tuple[str, int, int, Tuple[int, int]], ImageTk.PhotoImage] = {}
+
+    def font(self, size: int) -> tkinter.font.Font:
+        """Returns the font of the given size, shared by all desktops so that its metrics are only measured once."""
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = tkinter.font.Font(family="Arial", size=size, weight="normal")
+        return font
+
+    def request_icon(self, key: Optional[tuple], path: str, box: Tuple[int, int], results: queue.Queue) -> None:
+        """Decodes an icon on the worker pool, and puts (key, image) on the given queue once done. An icon that is
+        already being decoded for another desktop is not decoded twice."""
+        with self.decoding_lock:
+            waiting = self.decoding.get(key)
+            if waiting is not None:
+                waiting.append(results)
+                return
+            self.decoding[key] = [results]
+        self.icon_executor.submit(self.decode_icon, key, path, box)
+
+    def decode_icon(self, key: Optional[tuple], path: str, box: Tuple[int, int]) -> None:
+        """Runs on the icon worker pool. Must not touch any Tk object. Every waiter always gets a result, even if
+        decoding fails in an unexpected way (Eg: a DecompressionBombError), as it would otherwise wait forever."""
+        start = time.perf_counter()
+        try:
+            image = self.thumbnail_cache.load(path, box)
+        except Exception:
+            image = None
+        Profiler.recorder.observe("icon_decode", time.perf_counter() - start)
+        with self.decoding_lock:
+            waiting = self.decoding.pop(key)
+        for results in waiting:
+            results.put((key, image))
+
+    def load_wallpaper(self, key: Tuple[str, int, int, Tuple[int, int]]) -> Optional[ImageTk.PhotoImage]:
+        """Returns the wallpaper scaled to the resolution in the given key, or None if it could not be loaded. Desktops
+        showing the same wallpaper at the same resolution share one image, and images that no desktop shows any more
+        are dropped."""
+        image = self.wallpapers.get(key)
+        if image is None:
+            wallpaper = self.wallpaper_cache.load(key[0], key[3], mode=None)
+            if wallpaper is None:
+                return None
+            image = self.wallpapers[key] = ImageTk.PhotoImage(wallpaper)
+        in_use = set(desktop.wallpaper_key for desktop in self.app.desktops())
+        in_use.add(key)
+        for unused in [other for other in self.wallpapers if other not in in_use]:
+            del self.wallpapers[unused]
+        return image
+
+    def launch_failed(self, message: str) -> None:
+        """Runs on the launcher's thread."""
+        self.main_thread.post(lambda: msg.showwarning("Error", message))
+
+    def shut_down(self) -> None:
+        self.icon_executor.shutdown(wait=False, cancel_futures=True)
+        self.preview_executor.shutdown(wait=False, cancel_futures=True)
+
+
 class Desktop(tkinter.Frame):
-    def __init__(self, parent: "Window.MainWindow", script_path: str):
+    def __init__(self, parent: "Window.MainWindow", config: Config.Storage, services: Services):
         super().__init__(parent)
         self.root = parent
         self.resolution = (0, 0)
-        self.config = Config.Storage(script_path)
+        self.position = (0, 0)
+        self.config = config
+        self.services = services
         self.root_dir = os.path.dirname(__file__)
-        self.shortcuts: Tuple[Config.shortcuts, ...] = ()
-        self.icon_images = []
-        self.icon_handles = []
+        self.shortcuts: Tuple[Config.Shortcut, ...] = ()
+        self.menu_items: Config.MenuItems = ()
+        self.views: List[ShortcutView] = []
+        self.order: List[int] = []  # The indices of the views shown in the grid, in the order they are shown.
+        self.search_text = ""
+        self.search_index: Optional[Search.SearchIndex] = None
+        self.search_index_job: Optional[str] = None
+        self.search_handle: Optional[int] = None
+        self.search_box_handle: Optional[int] = None
+        self.label_height = 0
+        self.materialized: List[ShortcutView] = []  # The views that currently have canvas items.
+        self.item_pool: List[Tuple[int, int, int]] = []  # Hidden (rect, image, label) items ready to be reused.
+        self.scroll_column = 0
+        self.viewport_margin = 1  # Columns beyond each edge of the window that also get canvas items.
+        self.scroll_bar_handle: Optional[int] = None
+        self.icon_queue = queue.Queue()
+        self.icon_token = 0
+        self.pending_icons: Set[int] = set()
+        self.icon_waiters: Dict[Optional[tuple], List[ShortcutView]] = {}  # Views waiting for each icon being decoded.
+        self.icon_errors = 0
+        self.icon_poll_job: Optional[str] = None
+        self.icon_poll_interval = 15
+        self.icon_batch_start = 0.0
+        self.placeholder_icon: Optional[tkinter.PhotoImage] = None
+        self.preview_metadata = Preview.read_metadata(self.config.preview_path)
         self.window_size = []
         self.wallpaper_path = ""
         self.button_length = 0
@@ -28,34 +137,57 @@ class Desktop(tkinter.Frame):
         self.internal_padding = 0
         self.shortcut_font_size = 0
         self.context_font_size = 0
+        self.launch_limit = 0
+        self.icon_memory = 0
+        self.profiling = False
         self.resized_wallpaper = None
-        self.context_menu = None
+        self.wallpaper_handle: Optional[int] = None
+        self.wallpaper_key: Optional[Tuple[str, int, int, Tuple[int, int]]] = None
+        self.context_menu: Optional[ContextMenu] = None
+        self.layout: Optional[Global.GridLayout] = None
+        self.hovered_index: Optional[int] = None
+        self.pending_motion: Optional[tkinter.Event] = None
+        self.pointer: Optional[Tuple[int, int]] = None
+        self.motion_job: Optional[str] = None
+        self.motion_interval = 16  # Motion events are coalesced to at most one hit test per frame (~60 FPS).
+        self.timed_process_motion = Profiler.recorder.handler("motion.process", self.process_motion)
+        self.main_thread = services.main_thread
+        self.launcher = services.launcher
+        self.config_watcher = Watcher.FileWatcher(self.config.config_path, self.check_config)
         self.load_xml(first_load=True)
         self.load_static_data(first_load=True)
-        self.root.set_window_size(self.resolution)
-        self.shortcut_font = tkinter.font.Font(family="Arial", size=self.shortcut_font_size, weight="normal")
-        self.context_font = tkinter.font.Font(family="Arial", size=self.context_font_size, weight="normal")
+        self.root.set_window_size(self.resolution, self.position)
+        self.shortcut_font = services.font(self.shortcut_font_size)
+        self.context_font = services.font(self.context_font_size)
         self.content_canvas = tkinter.Canvas(self, background="black", borderwidth=0, highlightthickness=0)
         self.content_canvas.pack(expand=True, fill="both")
         self.load_shortcut_data(first_load=True)
         self.render_surface(self.resolution, first_load=True)
-        self.context_menu = ContextMenu(self.root, self.content_canvas, self.context_font,
-                                        ["Refresh Shortcuts", "Quit"],
-                                        [self.refresh_shortcuts, self.confirm_quit])
-        self.root.bind("<Motion>", self.motion)
-        self.root.bind("<ButtonRelease-1>", self.left_click)
-        self.root.bind("<ButtonRelease-3>", self.context_menu.show_menu)
+        self.context_menu = ContextMenu(self.root, self.content_canvas, self.context_font)
+        self.root.bind("<Motion>", Profiler.recorder.handler("motion", self.motion))
+        self.root.bind("<ButtonRelease-1>", Profiler.recorder.handler("left_click", self.left_click))
+        self.root.bind("<ButtonRelease-3>", Profiler.recorder.handler("context_menu.show", self.show_menu))
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.root.bind(sequence, self.scroll_wheel)
+        self.root.bind("<Prior>", lambda event: self.scroll_by(-self.visible_columns()))
+        self.root.bind("<Next>", lambda event: self.scroll_by(self.visible_columns()))
+        self.root.bind("<Key>", Profiler.recorder.handler("search.key", self.key_press))
+        self.config_watcher.start()
+        if not self.pending_icons:
+            self.phase_finished()
 
     def load_static_data(self, first_load: bool = False) -> None:
+        with Profiler.recorder.span("load_static_data"):
+            self.read_settings(first_load)
+        others = [desktop for desktop in self.root.app.desktops() if desktop is not self]
+        Profiler.recorder.configure(self.profiling or any(desktop.profiling for desktop in others))
+        # The icon pool is shared by every desktop, so its budget is the sum of theirs.
+        Cache.icon_pool.memory_limit = (self.icon_memory + sum(desktop.icon_memory for desktop in others)) * 1024 ** 2
+        Cache.icon_pool.trim()
+
+    def read_settings(self, first_load: bool) -> None:
         try:
-            self.resolution = tuple(int(i) for i in self.config.get_setting("resolution").split("x"))
-            self.wallpaper_path = os.path.normpath(self.config.get_setting("wallpaper"))
-            self.button_length = int(self.config.get_setting("button_length"))
-            self.cell_margin = int(self.config.get_setting("cell_margin"))
-            self.internal_padding = int(self.config.get_setting("internal_padding"))
-            self.shortcut_font_size = int(self.config.get_setting("shortcut_font-size"))
-            if first_load:
-                self.context_font_size = int(self.config.get_setting("context_font-size"))
+            settings = self.config.get_settings()
         except ValueError:
             message = "Malformed data found in the <settings> tag. Please ensure that you did not type in any " \
                       "non-numeric characters for settings that expect a numeric value."
@@ -64,7 +196,7 @@ class Desktop(tkinter.Frame):
                 raise SystemExit(1)
             else:
                 self.root.after_idle(lambda: msg.showwarning("Warning", message))
-        except AttributeError:
+        except KeyError:
             message = "Missing tag in the <settings> tag. Please check that you have not accidentally deleted any " \
                       "tags that were originally in the file. If you do not know how to fix the file, delete it. The " \
                       "file will be recreated with default settings."
@@ -73,42 +205,225 @@ class Desktop(tkinter.Frame):
                 raise SystemExit(1)
             else:
                 self.root.after_idle(lambda: msg.showwarning("Warning", message))
-        if not first_load:
-            self.shortcut_font = tkinter.font.Font(family="Arial", size=self.shortcut_font_size, weight="normal")
+        else:
+            self.resolution = settings.resolution
+            self.position = settings.position
+            self.wallpaper_path = settings.wallpaper_path
+            self.button_length = settings.button_length
+            self.cell_margin = settings.cell_margin
+            self.internal_padding = settings.internal_padding
+            self.shortcut_font_size = settings.shortcut_font_size
+            self.launch_limit = settings.launch_limit
+            self.icon_memory = settings.icon_memory
+            self.profiling = settings.profiling
+            self.context_font_size = settings.context_font_size
+        if not first_load and self.services.font(self.shortcut_font_size) is not self.shortcut_font:
+            self.shortcut_font = self.services.font(self.shortcut_font_size)
+            self.content_canvas.itemconfigure("shortcut_label", font=self.shortcut_font)
+        if not first_load and self.services.font(self.context_font_size) is not self.context_font:
+            self.context_font = self.services.font(self.context_font_size)
+            self.context_menu.set_font(self.context_font)
 
     def motion(self, event: tkinter.Event) -> None:
+        self.pending_motion = event
+        if self.motion_job is None:
+            self.motion_job = self.root.after(self.motion_interval, self.timed_process_motion)
+
+    def process_motion(self) -> None:
+        self.motion_job = None
+        event, self.pending_motion = self.pending_motion, None
+        if event is None:
+            return
+        self.pointer = (event.x, event.y)
         collide = self.context_menu.update(event)
-        for handle in self.content_canvas.find_withtag("shortcut_rect"):
-            hit_box = self.content_canvas.coords(handle)
-            if not collide and hit_box[0] <= event.x <= hit_box[2] and hit_box[1] <= event.y <= hit_box[3]:
-                self.content_canvas.itemconfigure(handle, state="normal")
-            else:
-                self.content_canvas.itemconfigure(handle, state="hidden")
+        self.set_hovered(None if collide else self.shortcut_at(event.x, event.y))
+
+    def set_hovered(self, index: Optional[int]) -> None:
+        """Moves the hover highlight to the given shortcut, only touching the rectangles whose state changes."""
+        if index == self.hovered_index:
+            return
+        if self.hovered_index is not None and self.views[self.hovered_index].rect_handle is not None:
+            self.content_canvas.itemconfigure(self.views[self.hovered_index].rect_handle, state="hidden")
+        if index is not None and self.views[index].rect_handle is not None:
+            self.content_canvas.itemconfigure(self.views[index].rect_handle, state="normal")
+        self.hovered_index = index
+
+    def shortcut_at(self, x: int, y: int) -> Optional[int]:
+        """Returns the index of the view under the given point, or None if there is none. Points outside the window,
+        which Tk reports while a button is held during a drag, never hit anything."""
+        if self.layout is None or not (0 <= x < self.resolution[0] and 0 <= y < self.resolution[1]):
+            return None
+        index = self.layout.index_at(x + self.scroll_column * self.layout.column_pitch, y)
+        return None if index is None else self.order[index]
 
     def left_click(self, event: tkinter.Event) -> None:
         collide = self.context_menu.click(event)
         if not collide:
-            command = None
-            for index, handle in enumerate(self.icon_handles):
-                hit_box = self.content_canvas.coords(handle)
-                if hit_box[0] <= event.x <= hit_box[2] and hit_box[1] <= event.y <= hit_box[3]:
-                    command = self.shortcuts[index].command
-                    break
+            index = self.shortcut_at(event.x, event.y)
+            if index is not None and self.views[index].shortcut.command is not None:
+                self.launcher.launch(self.views[index].shortcut.label_text, self.views[index].shortcut.command,
+                                     self.launch_limit)
+
+    def show_menu(self, event: tkinter.Event) -> None:
+        """Opens the context menu at the pointer. The actions of the shortcut under the pointer come first, then the
+        items from <context_menu>, then the built-in entries."""
+        labels: List[str] = []
+        callbacks: List[Callable[[], None]] = []
+        index = self.shortcut_at(event.x, event.y)
+        if index is not None:
+            shortcut = self.views[index].shortcut
+            for label, command in shortcut.actions:
+                if command is not None:
+                    labels.append(label)
+                    callbacks.append(self.launch_callback("{} - {}".format(shortcut.label_text, label), command))
+        for label, command in self.menu_items:
             if command is not None:
-                try:
-                    subprocess.Popen(command, shell=True)
-                except OSError as e:
-                    self.root.after_idle(lambda: msg.showwarning("Error",
-                                                                 "Failed to execute command. The command failed with "
-                                                                 "the below message:\n{}".format(e)))
+                labels.append(label)
+                callbacks.append(self.launch_callback(label, command))
+        labels.extend(("Refresh Shortcuts", "Quit"))
+        callbacks.extend((self.refresh_shortcuts, self.confirm_quit))
+        self.context_menu.set_items(labels, callbacks)
+        self.context_menu.show_menu(event.x, event.y)
+
+    def launch_callback(self, name: str, command: str) -> Callable[[], None]:
+        return lambda: self.launcher.launch(name, command, self.launch_limit)
+
+    def key_press(self, event: tkinter.Event) -> None:
+        """Typing on the desktop filters the shortcuts. Enter launches the first match, and Escape clears the search."""
+        if event.keysym == "Escape":
+            self.set_search("")
+        elif event.keysym in ("Return", "KP_Enter"):
+            if self.search_text and self.order:
+                shortcut = self.views[self.order[0]].shortcut
+                if shortcut.command is not None:
+                    self.launcher.launch(shortcut.label_text, shortcut.command, self.launch_limit)
+                self.set_search("")
+        elif event.keysym == "BackSpace":
+            self.set_search(self.search_text[:-1])
+        elif event.char and event.char.isprintable() and (self.search_text or not event.char.isspace()):
+            self.set_search(self.search_text + event.char)
+
+    def set_search(self, text: str) -> None:
+        if text == self.search_text:
+            return
+        self.search_text = text
+        with Profiler.recorder.span("search"):
+            self.filter_views(0)
+        self.update_search_bar()
+        if self.pointer is not None:
+            self.set_hovered(self.shortcut_at(*self.pointer))
+
+    def filter_views(self, column: int) -> None:
+        """Lays out the views that match the search text (all of them if there is none) in the grid, scrolled to the
+        given column. The views that stay in range keep their canvas items, which are only moved, and the ones that
+        leave it give them back to the item pool."""
+        self.set_hovered(None)
+        if self.search_text:
+            self.build_search_index()  # Normally already built, unless the user typed before the desktop was idle.
+            self.order = self.search_index.search(self.search_text)
+        else:
+            self.order = list(range(len(self.views)))
+        self.layout = Global.GridLayout(len(self.order), self.resolution[1], self.button_length, self.cell_margin,
+                                        self.internal_padding, self.label_height)
+        self.scroll_to(column)
+        with Profiler.recorder.span("canvas_items"):
+            self.update_viewport()
+
+    def build_search_index(self) -> None:
+        """Builds the search index from the current shortcuts, if it is not up to date. Runs when the desktop is idle
+        after the shortcuts were loaded, so that the first keystroke does not have to wait for it."""
+        if self.search_index_job is not None:
+            self.root.after_cancel(self.search_index_job)
+            self.search_index_job = None
+        if self.search_index is None:
+            with Profiler.recorder.span("search_index"):
+                self.search_index = Search.SearchIndex(self.shortcuts)
+
+    def update_search_bar(self) -> None:
+        """Shows the search text and the number of matches in the top left corner while a search is active."""
+        if not self.search_text:
+            if self.search_handle is not None:
+                self.content_canvas.itemconfigure("search_bar", state="hidden")
+            return
+        text = "Search: {}  ({} of {})".format(self.search_text, len(self.order), len(self.views))
+        if self.search_handle is None:
+            self.search_box_handle = self.content_canvas.create_rectangle(0, 0, 0, 0, fill="black", outline="",
+                                                                          tags="search_bar")
+            self.search_handle = self.content_canvas.create_text(self.cell_margin, self.cell_margin / 2, anchor="w",
+                                                                 font=self.shortcut_font, fill="white",
+                                                                 tags="search_bar")
+        self.content_canvas.itemconfigure(self.search_handle, text=text, font=self.shortcut_font)
+        self.content_canvas.itemconfigure("search_bar", state="normal")
+        x0, y0, x1, y1 = self.content_canvas.bbox(self.search_handle)
+        self.content_canvas.coords(self.search_box_handle, x0 - 4, y0 - 2, x1 + 4, y1 + 2)
+        self.content_canvas.tag_raise("search_bar")
+        if self.context_menu is not None:
+            self.context_menu.lift_to_top()
+
+    def check_config(self) -> None:
+        """Runs on the config watcher's thread whenever the config file was saved, and refreshes the desktop if any
+        setting or shortcut actually changed."""
+        if self.config.detect_changes():
+            self.main_thread.post(self.refresh_shortcuts)
 
     def refresh_shortcuts(self) -> None:
-        self.load_shortcut_data()
-        self.render_surface(self.resolution)
+        Profiler.recorder.phase = "refresh"
+        with Profiler.recorder.span("refresh"):
+            self.load_shortcut_data()
+            self.render_surface(self.resolution)
+        if not self.pending_icons:
+            self.phase_finished()
+
+    def phase_finished(self) -> None:
+        """Called once startup or a refresh has completely finished, including the loading of icons."""
+        for name, value in Cache.icon_pool.stats().items():
+            Profiler.recorder.gauge("icon_pool.{}".format(name), value)
+        Profiler.recorder.dump(self.config.profile_path)
+        self.root.show_desktop(self)
+        self.save_preview()
+
+    def save_preview(self) -> None:
+        """Saves what is currently on screen as the preview for the next start, unless the grid is scrolled or filtered,
+        or the same preview has already been saved. The image is put together and written on a background thread."""
+        if self.scroll_column != 0 or self.search_text or self.wallpaper_key is None:
+            return
+        sources = [list(self.wallpaper_key[:3])]
+        icons = []
+        labels = []
+        for view in self.materialized:
+            if view.box is None or view.box[0] >= self.resolution[0]:
+                continue
+            labels.append([view.label_position[0], view.label_position[1], view.text])
+            if view.pool_key is not None:
+                icons.append((Cache.icon_pool.image(view.pool_key), view.image_position))
+                if list(view.pool_key[:3]) not in sources:
+                    sources.append(list(view.pool_key[:3]))
+        metadata = {"format": Preview.format_version, "config_hash": self.config.content_hash,
+                    "resolution": list(self.resolution), "position": list(self.position),
+                    "font_size": self.shortcut_font_size, "sources": sources, "labels": labels}
+        if metadata != self.preview_metadata:
+            self.preview_metadata = metadata
+            self.services.preview_executor.submit(self.write_preview, metadata, icons)
+
+    def write_preview(self, metadata: Dict[str, Any], icons: List[Tuple[Any, Tuple[int, int]]]) -> None:
+        """Runs on the preview thread. Must not touch any Tk object."""
+        # The old metadata goes first, so that it can never be paired with the new image.
+        with suppress(OSError):
+            os.remove(self.config.preview_path)
+        resolution = tuple(metadata["resolution"])
+        wallpaper = self.services.wallpaper_cache.load(metadata["sources"][0][0], resolution, mode=None)
+        if wallpaper is not None \
+                and Cache.write_flattened(self.config.preview_image_path, wallpaper, resolution, icons):
+            Preview.write_metadata(self.config.preview_path, metadata)
 
     def load_xml(self, first_load: bool = False) -> None:
-        if self.config.init_xml_data():
+        with Profiler.recorder.span("load_xml"):
+            loaded = self.config.init_xml_data()
+        if loaded:
+            if self.config.get_shortcut_data() is not self.shortcuts:
+                self.search_index = None  # Rebuilt from the new shortcuts by sync_views().
             self.shortcuts = self.config.get_shortcut_data()
+            self.menu_items = self.config.get_menu_data()
         else:
             if first_load:
                 msg.showerror("Fatal Error", "Failed to load XML data.")
@@ -120,186 +435,476 @@ class Desktop(tkinter.Frame):
         if not first_load:
             self.load_xml()
             self.load_static_data()
-            self.root.set_window_size(self.resolution)
-        self.icon_images.clear()
-        errors = 0
-        for s in self.shortcuts:
-            try:
-                image = Image.open(os.path.expandvars(os.path.expanduser(os.path.normpath(s.icon_path))))\
-                                  .convert("RGBA")
-            except (OSError, UnidentifiedImageError):
-                self.icon_images.append(None)
-                errors += 1
+            self.root.set_window_size(self.resolution, self.position)
+        with Profiler.recorder.span("sync_views"):
+            self.sync_views()
+
+    def sync_views(self) -> None:
+        """Diffs the loaded shortcuts against the ones currently on the desktop. Shortcuts that did not change keep
+        their view (and with it their canvas items and icon), edited ones recycle the view of a removed shortcut, and
+        the views of the remaining removed shortcuts give their canvas items back to the item pool."""
+        self.set_hovered(None)
+        unchanged: Dict[Config.Shortcut, List[ShortcutView]] = {}
+        for view in reversed(self.views):
+            unchanged.setdefault(view.shortcut, []).append(view)
+        new_views: List[Optional[ShortcutView]] = []
+        edited = []
+        for index, shortcut in enumerate(self.shortcuts):
+            matches = unchanged.get(shortcut)
+            new_views.append(matches.pop() if matches else None)
+            if new_views[-1] is None:
+                edited.append(index)
+        kept = set(id(view) for view in new_views if view is not None)
+        leftovers = [view for view in reversed(self.views) if id(view) not in kept]
+        for index in edited:
+            if leftovers:
+                new_views[index] = leftovers.pop()
+                new_views[index].set_shortcut(self.shortcuts[index])
             else:
-                resized = image.resize(Global.resize_image(image.size,
-                                                           (self.button_length - self.internal_padding * 2,) * 2))
-                self.icon_images.append(ImageTk.PhotoImage(resized))
-        if errors:
+                new_views[index] = ShortcutView(self.shortcuts[index])
+        for view in leftovers:
+            self.release_view(view)
+        self.views = new_views
+        for view in self.views:
+            view.failed_source = ShortcutView.unset  # Icons that failed to load are retried on every refresh.
+        icon_box = (self.button_length - self.internal_padding * 2,) * 2
+        if self.placeholder_icon is None or (self.placeholder_icon.width(), self.placeholder_icon.height()) != icon_box:
+            self.placeholder_icon = self.make_placeholder(icon_box)
+        if self.search_index is None and self.search_index_job is None:
+            self.search_index_job = self.root.after_idle(self.build_search_index)
+
+    def ensure_icon(self, view: "ShortcutView") -> None:
+        """Gives the given view its icon from the icon pool, or queues the icon to be decoded on the worker pool, unless
+        it is already loaded (or loading) from an unchanged source, or is known to be broken. Views that show the same
+        icon share a single decode. The view shows a placeholder until the icon arrives, unless it already has an icon,
+        which is kept until it is replaced."""
+        box = (self.button_length - self.internal_padding * 2,) * 2
+        key = view.icon_key(box)
+        if key == view.icon_source and (view.loading or view.image is not None) or key == view.failed_source:
+            return
+        self.pending_icons.discard(view.icon_token)
+        view.icon_source = key
+        waiters = self.icon_waiters.get(key)
+        # A view that joins a decode already in flight is not another miss of the pool.
+        image = Cache.icon_pool.acquire(key) if key is not None and waiters is None else None
+        if image is not None:
+            view.icon_token = 0
+            view.loading = False
+            self.set_icon(view, image, key)
+            return
+        if not self.pending_icons:
+            self.icon_batch_start = time.perf_counter()
+        self.icon_token += 1
+        view.icon_token = self.icon_token
+        self.pending_icons.add(view.icon_token)
+        if view.image is None or view.loading:
+            self.set_icon(view, self.placeholder_icon)
+        view.loading = True
+        if waiters is not None:
+            waiters.append(view)
+        else:
+            self.icon_waiters[key] = [view]
+            self.services.request_icon(key, view.icon_path, box, self.icon_queue)
+        # Polling stops whenever no view is pending, even if decodes are still in flight, so a view that joins one of
+        # those has to start it again.
+        if self.icon_poll_job is None:
+            self.icon_poll_job = self.root.after(self.icon_poll_interval, self.receive_icons)
+
+    def release_view(self, view: "ShortcutView") -> None:
+        """Hides the canvas items of the given view and gives them back to the item pool, and drops its icon."""
+        self.pending_icons.discard(view.icon_token)
+        view.icon_token = 0
+        view.loading = False
+        self.set_icon(view, None)
+        view.icon_source = ShortcutView.unset
+        if view.rect_handle is None:
+            return
+        self.content_canvas.itemconfigure(view.image_handle, state="hidden")
+        self.content_canvas.itemconfigure(view.label_handle, state="hidden")
+        self.item_pool.append((view.rect_handle, view.image_handle, view.label_handle))
+        view.rect_handle = view.image_handle = view.label_handle = None
+        view.box = view.image_position = view.label_position = None
+        view.text = ""
+
+    def make_placeholder(self, box: Tuple[int, int]) -> Optional[tkinter.PhotoImage]:
+        if box[0] <= 0 or box[1] <= 0:
+            return None
+        placeholder = tkinter.PhotoImage(master=self.root, width=box[0], height=box[1])
+        placeholder.put("#5a5a5a", to=(0, 0, box[0], box[1]))
+        return placeholder
+
+    def receive_icons(self) -> None:
+        """Runs on the Tk thread, adding the icons decoded so far to the icon pool and swapping them into the canvas
+        slots of the views waiting for them. Views that were released or re-requested in the meantime are skipped, but
+        their icons are still kept in the pool."""
+        self.icon_poll_job = None
+        while True:
+            try:
+                key, image = self.icon_queue.get_nowait()
+            except queue.Empty:
+                break
+            waiters = []
+            for view in self.icon_waiters.pop(key, ()):
+                if view.icon_token not in self.pending_icons or not view.loading or view.icon_source != key:
+                    continue
+                self.pending_icons.discard(view.icon_token)
+                view.loading = False
+                waiters.append(view)
+            if image is None or key is None:
+                for view in waiters:
+                    self.icon_errors += 1
+                    view.failed_source = key
+                    self.set_icon(view, None)
+                continue
+            photo = Cache.icon_pool.add(key, image, len(waiters))
+            for view in waiters:
+                self.set_icon(view, photo, key)
+        Cache.icon_pool.trim()
+        if self.pending_icons:
+            self.icon_poll_job = self.root.after(self.icon_poll_interval, self.receive_icons)
+            return
+        Profiler.recorder.add_span("icons", self.icon_batch_start, time.perf_counter())
+        self.phase_finished()
+        if self.icon_errors:
+            errors, self.icon_errors = self.icon_errors, 0
             self.root.after_idle(lambda: msg.showwarning("Warning",
                                                          "An error occurred while trying to load {} shortcut icon(s). "
                                                          "They will be left blank until the next time you refresh the "
                                                          "shortcuts.".format(errors)))
 
-    def word_wrap_labels(self) -> List[List[str]]:
-        return [Global.word_wrap_text(data.label_text,
-                                      self.button_length - 2 * self.internal_padding,
-                                      self.shortcut_font) for data in self.shortcuts]
+    def set_icon(self, view: "ShortcutView", image: Optional[tkinter.PhotoImage], pool_key: Optional[tuple] = None) \
+            -> None:
+        """Shows the given image on the view. Images from the icon pool pass their key, so that the pool knows which of
+        its images are in use."""
+        if view.pool_key is not None:
+            Cache.icon_pool.release(view.pool_key)
+        view.pool_key = pool_key
+        view.image = image
+        if view.image_handle is not None:
+            self.content_canvas.itemconfigure(view.image_handle, image=image or "")
 
     def render_surface(self, resolution: Tuple[int, int], first_load: bool = False, force_reload: bool = False) -> None:
         self.resolution = resolution
-        self.content_canvas.delete("shortcut")
-        self.icon_handles.clear()
         if force_reload:
             self.load_xml()
             self.load_static_data()
-        try:
-            wallpaper = Image.open(self.wallpaper_path)
-        except (OSError, UnidentifiedImageError):
+            self.sync_views()
+        with Profiler.recorder.span("wallpaper"):
+            loaded = self.load_wallpaper()
+        if not loaded:
             message = "Failed to load the wallpaper image at {}".format(self.wallpaper_path)
             if first_load:
                 msg.showerror("Fatal Error", message)
                 raise SystemExit(1)
             else:
                 self.root.after_idle(lambda: msg.showwarning("Warning", message))
+        if self.wallpaper_handle is None:
+            self.wallpaper_handle = self.content_canvas.create_image(resolution[0] / 2, resolution[1] / 2,
+                                                                     image=self.resized_wallpaper,
+                                                                     tags=("shortcut", "shortcut_wallpaper"))
+            self.scroll_bar_handle = self.content_canvas.create_rectangle(0, 0, 0, 0, fill="#ffffff", outline="",
+                                                                          stipple="gray50", state="hidden",
+                                                                          tags=("shortcut", "shortcut_scroll_bar"))
         else:
-            self.resized_wallpaper = ImageTk.PhotoImage(wallpaper.resize(Global.resize_image(wallpaper.size,
-                                                                                             self.resolution)))
-        self.content_canvas.create_image(resolution[0] / 2,
-                                         resolution[1] / 2,
-                                         image=self.resized_wallpaper,
-                                         tags=("shortcut", "shortcut_wallpaper"))
-        wrapped_labels = self.word_wrap_labels()
-        max_label_height = max(len(lines) for lines in wrapped_labels) * self.shortcut_font.metrics("linespace")
-        accumulated_width = self.cell_margin
-        accumulated_height = self.cell_margin
-        for index in range(len(self.shortcuts)):
-            label_width = max(self.shortcut_font.measure(line) for line in wrapped_labels[index])
-            if sum((accumulated_height, self.button_length, 2 * self.internal_padding, max_label_height,
-                    self.cell_margin)) > self.resolution[1]:
-                accumulated_width += self.button_length + self.cell_margin
-                accumulated_height = self.cell_margin
-            self.icon_handles.append(self.content_canvas.create_rectangle(accumulated_width,
-                                                                          accumulated_height,
-                                                                          accumulated_width + self.button_length,
-                                                                          (accumulated_height
-                                                                           + self.button_length
-                                                                           + 2 * self.internal_padding
-                                                                           + max_label_height),
-                                                                          fill="#ffb6c1",
-                                                                          tags=("shortcut", "shortcut_rect")))
-            self.content_canvas.itemconfigure(self.icon_handles[-1], state="hidden")
-            if self.icon_images[index] is not None:
-                self.content_canvas.create_image(accumulated_width + self.internal_padding,
-                                                 accumulated_height + self.internal_padding,
-                                                 image=self.icon_images[index],
-                                                 anchor="nw",
-                                                 tags=("shortcut", "shortcut_icon"))
-            self.content_canvas.create_text(accumulated_width + (self.button_length / 2 - label_width / 2),
-                                            accumulated_height + self.button_length + self.internal_padding,
-                                            text="\n".join(wrapped_labels[index]),
-                                            anchor="nw",
-                                            font=self.shortcut_font,
-                                            fill="white",
-                                            tags=("shortcut", "shortcut_label"))
-            accumulated_height += sum((self.button_length, 2 * self.internal_padding, max_label_height,
-                                       self.cell_margin))
+            self.content_canvas.coords(self.wallpaper_handle, resolution[0] / 2, resolution[1] / 2)
+            self.content_canvas.itemconfigure(self.wallpaper_handle, image=self.resized_wallpaper)
+        wrap_key = (self.button_length - 2 * self.internal_padding, self.shortcut_font_size)
+        with Profiler.recorder.span("word_wrap"):
+            for view in self.views:
+                if view.lines is None or view.wrap_key != wrap_key:
+                    view.lines, line_widths = Global.text_layout.wrap(view.shortcut.label_text, wrap_key[0],
+                                                                      self.shortcut_font)
+                    view.label_width = max(line_widths)
+                    view.wrap_key = wrap_key
+        self.label_height = max((len(view.lines) for view in self.views), default=0) \
+            * self.shortcut_font.metrics("linespace")
+        self.filter_views(self.scroll_column)
+        self.update_search_bar()
+        self.content_canvas.tag_lower(self.wallpaper_handle)
         if self.context_menu is not None:
             self.context_menu.lift_to_top()
 
+    def update_viewport(self) -> None:
+        """Makes sure that exactly the shortcuts in the visible columns (plus a margin of columns on either side) have
+        canvas items and icons. Views that scrolled out of range give their items back to the pool, and views that
+        scrolled into range take them from it."""
+        first_column = self.scroll_column - self.viewport_margin
+        end_column = self.scroll_column + self.visible_columns() + self.viewport_margin
+        start, end = self.layout.index_range(first_column, end_column)
+        in_range = [self.views[index] for index in self.order[start:end]]
+        kept = set(id(view) for view in in_range)
+        for view in self.materialized:
+            if id(view) not in kept:
+                self.release_view(view)
+        self.materialized = in_range
+        for index, view in enumerate(in_range, start):
+            self.place_view(view, self.screen_box(index))
+            self.ensure_icon(view)
+        while len(self.item_pool) > len(self.materialized):
+            for handle in self.item_pool.pop():
+                self.content_canvas.delete(handle)
+        self.update_scroll_bar()
+
+    def visible_columns(self) -> int:
+        """Returns the number of columns that are at least partly visible."""
+        if self.layout.column_pitch <= 0:
+            return 1
+        return max(1, math.ceil((self.resolution[0] - self.cell_margin) / self.layout.column_pitch))
+
+    def scroll_by(self, columns: int) -> None:
+        self.scroll_to(self.scroll_column + columns)
+        self.update_viewport()
+        if self.pointer is not None:
+            self.set_hovered(self.shortcut_at(*self.pointer))
+
+    def scroll_to(self, column: int) -> None:
+        """Scrolls the grid so that the given column is the leftmost one. The canvas items of the views in range are
+        moved with a single move() call; update_viewport() has to be called afterwards."""
+        full_columns = max(1, (self.resolution[0] - self.cell_margin) // max(self.layout.column_pitch, 1))
+        column = max(0, min(column, self.layout.column_count - full_columns))
+        if column == self.scroll_column:
+            return
+        self.set_hovered(None)
+        dx = (self.scroll_column - column) * self.layout.column_pitch
+        self.content_canvas.move("shortcut_cell", dx, 0)
+        for view in self.materialized:
+            view.shift(dx)
+        self.scroll_column = column
+
+    def scroll_wheel(self, event: tkinter.Event) -> None:
+        if event.num == 4 or event.delta > 0:
+            self.scroll_by(-1)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_by(1)
+
+    def update_scroll_bar(self) -> None:
+        """Shows a thin bar along the bottom edge that indicates which part of the grid is visible, if the grid does not
+        fit in the window."""
+        column_count = self.layout.column_count
+        visible = min(self.visible_columns(), column_count)
+        if visible >= column_count:
+            self.content_canvas.itemconfigure(self.scroll_bar_handle, state="hidden")
+            return
+        width = self.resolution[0]
+        self.content_canvas.coords(self.scroll_bar_handle, width * self.scroll_column / column_count,
+                                   self.resolution[1] - 4, width * (self.scroll_column + visible) / column_count,
+                                   self.resolution[1])
+        self.content_canvas.itemconfigure(self.scroll_bar_handle, state="normal")
+
+    def screen_box(self, index: int) -> Tuple[int, int, int, int]:
+        x0, y0, x1, y1 = self.layout.cell_box(index)
+        scroll_x = self.scroll_column * self.layout.column_pitch
+        return x0 - scroll_x, y0, x1 - scroll_x, y1
+
+    def place_view(self, view: "ShortcutView", box: Tuple[int, int, int, int]) -> None:
+        """Gives the given view canvas items in the given cell, taking them from the item pool or creating them, or
+        moves its existing items there. Only the items whose position or text actually changed are touched."""
+        image_position = (box[0] + self.internal_padding, box[1] + self.internal_padding)
+        label_position = (box[0] + (self.button_length / 2 - view.label_width / 2),
+                          box[1] + self.button_length + self.internal_padding)
+        text = "\n".join(view.lines)
+        if view.rect_handle is None and self.item_pool:
+            view.rect_handle, view.image_handle, view.label_handle = self.item_pool.pop()
+            self.content_canvas.itemconfigure(view.image_handle, state="normal", image=view.image or "")
+            self.content_canvas.itemconfigure(view.label_handle, state="normal")
+        if view.rect_handle is None:
+            view.rect_handle = self.content_canvas.create_rectangle(*box, fill="#ffb6c1", state="hidden",
+                                                                    tags=("shortcut", "shortcut_cell",
+                                                                          "shortcut_rect"))
+            view.image_handle = self.content_canvas.create_image(*image_position, image=view.image or "",
+                                                                 anchor="nw",
+                                                                 tags=("shortcut", "shortcut_cell", "shortcut_icon"))
+            view.label_handle = self.content_canvas.create_text(*label_position, text=text, anchor="nw",
+                                                                font=self.shortcut_font, fill="white",
+                                                                tags=("shortcut", "shortcut_cell", "shortcut_label"))
+        else:
+            if box != view.box:
+                self.content_canvas.coords(view.rect_handle, *box)
+            if image_position != view.image_position:
+                self.content_canvas.coords(view.image_handle, *image_position)
+            if label_position != view.label_position:
+                self.content_canvas.coords(view.label_handle, *label_position)
+            if text != view.text:
+                self.content_canvas.itemconfigure(view.label_handle, text=text)
+        view.box, view.image_position, view.label_position, view.text = box, image_position, label_position, text
+
+    def load_wallpaper(self) -> bool:
+        """Updates the scaled wallpaper image, reusing the current one if neither the wallpaper file nor the resolution
+        has changed. A bool is returned to indicate if the wallpaper could be loaded."""
+        path = self.wallpaper_path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        key = (path, stat.st_mtime_ns, stat.st_size, self.resolution)
+        if key == self.wallpaper_key:
+            return True
+        wallpaper = self.services.load_wallpaper(key)
+        if wallpaper is None:
+            return False
+        self.resized_wallpaper = wallpaper
+        self.wallpaper_key = key
+        return True
+
     def confirm_quit(self) -> None:
         if msg.askyesno("Really Quit?", "Are you sure you want to quit?"):
-            self.root.destroy()
+            self.root.app.close()
+
+    def shut_down(self) -> None:
+        self.config_watcher.stop()
+        Profiler.recorder.dump(self.config.profile_path)
+
+
+class ShortcutView:
+    """The state of one shortcut on the desktop, kept across refreshes so that unchanged shortcuts do not have to be
+    redrawn. Only shortcuts in or near the visible columns have canvas items and an icon."""
+    unset = object()  # Icon source of a view whose icon was never requested.
+
+    def __init__(self, shortcut: Config.Shortcut):
+        self.shortcut = shortcut
+        self.icon_path = ""
+        self.icon_source: Optional[tuple] = ShortcutView.unset
+        self.failed_source: Optional[tuple] = ShortcutView.unset
+        self.icon_token = 0
+        self.loading = False
+        self.image: Optional[tkinter.PhotoImage] = None
+        self.pool_key: Optional[tuple] = None  # The key of the image if it came from the icon pool.
+        self.lines: Optional[List[str]] = None
+        self.label_width = 0
+        self.wrap_key: Optional[Tuple[int, int]] = None
+        self.rect_handle: Optional[int] = None
+        self.image_handle: Optional[int] = None
+        self.label_handle: Optional[int] = None
+        self.box: Optional[Tuple[int, int, int, int]] = None
+        self.image_position: Optional[Tuple[int, int]] = None
+        self.label_position: Optional[Tuple[float, int]] = None
+        self.text = ""
+        self.set_shortcut(shortcut)
+
+    def set_shortcut(self, shortcut: Config.Shortcut) -> None:
+        if shortcut.label_text != self.shortcut.label_text:
+            self.lines = None
+        self.shortcut = shortcut
+        self.icon_path = shortcut.icon_file
+
+    def shift(self, dx: int) -> None:
+        """Updates the recorded positions of the view's items after they were moved horizontally."""
+        if self.box is not None:
+            self.box = (self.box[0] + dx, self.box[1], self.box[2] + dx, self.box[3])
+            self.image_position = (self.image_position[0] + dx, self.image_position[1])
+            self.label_position = (self.label_position[0] + dx, self.label_position[1])
+
+    def icon_key(self, box: Tuple[int, int]) -> Optional[tuple]:
+        """Returns a key that changes whenever the icon has to be reloaded, or None if the icon file is missing."""
+        try:
+            stat = os.stat(self.icon_path)
+        except OSError:
+            return None
+        return self.icon_path, stat.st_mtime_ns, stat.st_size, box
 
 
 class ContextMenu:
-    def __init__(self, root: "Window.MainWindow", parent: tkinter.Canvas, font: tkinter.font.Font, labels: List[str],
-                 callbacks: List[Callable[[], None]]):
-        self.display = True
-        self.items = labels
-        self.callbacks = callbacks
-        self.button_handles = []
-        self.coord_offsets = []
-        self.offset_id = 0
+    """Menu drawn on the desktop canvas. The handles of its items and its geometry are kept in local tables, so that
+    showing, hovering and clicking never have to query the canvas: the whole menu is moved with a single move() on the
+    "context_menu" tag, and hovering only restyles the items whose highlight actually changes. set_items() rebuilds
+    the menu in place, reusing the existing canvas items, so that it can change each time it is opened."""
+    def __init__(self, root: "Window.MainWindow", parent: tkinter.Canvas, font: tkinter.font.Font):
+        self.display = False
+        self.items: List[str] = []
+        self.callbacks: List[Callable[[], None]] = []
+        self.button_handles: List[int] = []
+        self.text_handles: List[int] = []
+        self.hovered: Optional[int] = None
         self.h_pad = 30
         self.v_pad = 5
         self.root = root
         self.parent = parent
         self.font = font
-        self.width = max(self.font.measure(label) for label in self.items) + self.h_pad
+        self.origin = (0, 0)  # Where the top left corner of the menu currently is on the canvas.
+        self.width = 0
+        self.height = 0
         self.option_height = self.font.metrics("linespace") + self.v_pad
-        self.height = self.option_height * len(self.items)
-        self.content_frame = self.parent.create_rectangle(0, 0, self.width, self.height, fill="#f2f2f2",
-                                                          tags="context_menu")
-        for index, label in enumerate(self.items):
-            self.coord_offsets.append((0, self.option_height * index, self.width,
-                                       self.option_height * index + self.option_height))
-            self.button_handles.append(self.parent.create_rectangle(*self.coord_offsets[self.offset_id], fill="#a1f3ff",
-                                                                    tags=("context_menu", "button_rect",
-                                                                          "menuitem{}".format(self.offset_id))))
-            self.coord_offsets.append((self.h_pad / 2, self.option_height * index + self.v_pad / 2))
-            self.parent.create_text(*self.coord_offsets[self.offset_id + 1], text=label, anchor="nw", font=self.font,
-                                    fill="black", tags=("context_menu", "menuitem{}".format(self.offset_id + 1)))
-            self.offset_id += 2
-        self.hide_menu()
+        self.content_frame = self.parent.create_rectangle(0, 0, 0, 0, fill="#f2f2f2", state="hidden",
+                                                          tags=("context_menu", "context_menu_body"))
+
+    def set_items(self, labels: List[str], callbacks: List[Callable[[], None]]) -> None:
+        """Replaces the entries of the menu. The canvas items are only touched if the labels changed."""
+        self.callbacks = list(callbacks)
+        if labels == self.items:
+            return
+        self.set_hovered(None)
+        state = "normal" if self.display else "hidden"
+        while len(self.button_handles) < len(labels):
+            self.button_handles.append(self.parent.create_rectangle(0, 0, 0, 0, fill="#a1f3ff", state="hidden",
+                                                                    tags=("context_menu", "button_rect")))
+            self.text_handles.append(self.parent.create_text(0, 0, anchor="nw", fill="black", state=state,
+                                                             tags=("context_menu", "context_menu_body")))
+        while len(self.button_handles) > len(labels):
+            self.parent.delete(self.button_handles.pop(), self.text_handles.pop())
+        x, y = self.origin
+        self.width = max(self.font.measure(label) for label in labels) + self.h_pad
+        self.height = self.option_height * len(labels)
+        for index, label in enumerate(labels):
+            top = y + self.option_height * index
+            self.parent.coords(self.button_handles[index], x, top, x + self.width, top + self.option_height)
+            self.parent.coords(self.text_handles[index], x + self.h_pad / 2, top + self.v_pad / 2)
+            self.parent.itemconfigure(self.text_handles[index], text=label, font=self.font)
+        self.parent.coords(self.content_frame, x, y, x + self.width, y + self.height)
+        self.items = list(labels)
+
+    def set_font(self, font: tkinter.font.Font) -> None:
+        self.font = font
+        self.option_height = self.font.metrics("linespace") + self.v_pad
+        labels, self.items = self.items, []
+        if labels:
+            self.set_items(labels, self.callbacks)
+
+    def index_at(self, x: int, y: int) -> Optional[int]:
+        """Returns the index of the entry at the given canvas coordinates, or None if the menu is not there."""
+        if not self.display:
+            return None
+        left, top = self.origin
+        if left <= x < left + self.width and top <= y < top + self.height:
+            return min(int((y - top) // self.option_height), len(self.items) - 1)
+        return None
+
+    def set_hovered(self, index: Optional[int]) -> None:
+        if index == self.hovered:
+            return
+        if self.hovered is not None:
+            self.parent.itemconfigure(self.button_handles[self.hovered], state="hidden")
+        if index is not None:
+            self.parent.itemconfigure(self.button_handles[index], state="normal")
+        self.hovered = index
 
     def update(self, event: tkinter.Event) -> bool:
         if self.display:
-            collide = False
-            for handle in self.button_handles:
-                hit_box = self.parent.coords(handle)
-                if hit_box[0] <= event.x <= hit_box[2] and hit_box[1] <= event.y < hit_box[3]:
-                    collide = True
-                    self.parent.itemconfigure(handle, state="normal")
-                else:
-                    self.parent.itemconfigure(handle, state="hidden")
-            return collide
+            index = self.index_at(event.x, event.y)
+            self.set_hovered(index)
+            return index is not None
         return False
 
     def click(self, event: tkinter.Event) -> bool:
         if self.display:
-            frame_hit_box = self.parent.coords(self.content_frame)
-            if frame_hit_box[0] <= event.x < frame_hit_box[2] and frame_hit_box[1] <= event.y < frame_hit_box[3]:
-                collide = False
-                for index, handle in enumerate(self.button_handles):
-                    hit_box = self.parent.coords(handle)
-                    if hit_box[0] <= event.x < hit_box[2] and hit_box[1] <= event.y < hit_box[3]:
-                        collide = True
-                        self.root.after_idle(self.callbacks[index])
-                        self.hide_menu()
-                        break
-                return collide
-            else:
-                self.hide_menu()
-                return False
+            index = self.index_at(event.x, event.y)
+            if index is not None:
+                self.root.after_idle(self.callbacks[index])
+            self.hide_menu()
+            return index is not None
         return False
 
-    def show_menu(self, event: tkinter.Event) -> None:
+    def show_menu(self, x: int, y: int) -> None:
+        self.parent.move("context_menu", x - self.origin[0], y - self.origin[1])
+        self.origin = (x, y)
+        self.set_hovered(None)
+        self.parent.itemconfigure("context_menu_body", state="normal")
+        self.parent.tag_raise("context_menu")  # Items created since the last render may have been stacked above it.
         self.display = True
-        for index, coord in enumerate(self.coord_offsets):
-            handle = self.parent.find_withtag("menuitem{}".format(index))[0]
-            if handle == self.content_frame:
-                continue
-            id_type = self.parent.type(handle)
-            if id_type == "rectangle":
-                self.parent.coords(handle, event.x + coord[0], event.y + coord[1], event.x + coord[2],
-                                   event.y + coord[3])
-            elif id_type == "text":
-                self.parent.coords(handle, event.x + coord[0], event.y + coord[1])
-                self.parent.itemconfigure(handle, state="normal")
-        self.parent.coords(self.content_frame,
-                           event.x,
-                           event.y,
-                           event.x + self.width,
-                           event.y + self.height)
-        self.parent.itemconfigure(self.content_frame, state="normal")
 
     def hide_menu(self) -> None:
         self.display = False
-        for handle in self.parent.find_withtag("context_menu"):
-            self.parent.itemconfigure(handle, state="hidden")
+        self.hovered = None
+        self.parent.itemconfigure("context_menu", state="hidden")
 
     def lift_to_top(self) -> None:
-        self.parent.tag_raise(self.content_frame)
-        for index in range(self.offset_id):
-            handle = self.parent.find_withtag("menuitem{}".format(index))[0]
-            self.parent.tag_raise(handle)
+        self.parent.tag_raise("context_menu")
@@ -1,7 +1,10 @@
+from collections import OrderedDict
 from contextlib import suppress
 from typing import *
 import platform
+import queue
 import tkinter
+import tkinter.font
 import math
 with suppress(ImportError):
     from ctypes import windll
@@ -17,32 +20,188 @@ def resize_image(original_size: Tuple[int, int], new_size: Tuple[int, int]) -> T
     return scaled_size
 
 
-def word_wrap_text(string: str, width: int, font: tkinter.font.Font, br: str = "-") -> List[str]:
-    lines, break_locations = [[]], []
-    for index, char in enumerate(string):
-        if char == " ":
-            break_locations.append(len(lines[-1]))
-            lines[-1].append(char)
-            continue
-        elif char == "\n":
-            break_locations.clear()
-            lines.append([])
-            continue
-        if font.measure("".join(lines[-1] + [char, br])) <= width:
-            lines[-1].append(char)
+class GridLayout:
+    """Column-major cell layout of the shortcut grid. Maps shortcut indices to cell positions and pointer positions
+    back to shortcut indices without looking at any canvas item."""
+    def __init__(self, count: int, height: int, button_length: int, cell_margin: int, internal_padding: int,
+                 label_height: int):
+        self.count = count
+        self.margin = cell_margin
+        self.cell_width = button_length
+        self.cell_height = button_length + 2 * internal_padding + label_height
+        self.column_pitch = self.cell_width + self.margin
+        self.row_pitch = self.cell_height + self.margin
+        free_height = height - 2 * self.margin - self.cell_height
+        if free_height < 0 or self.row_pitch <= 0:
+            # Not even a single cell fits vertically, so every shortcut starts a new column (the first one included).
+            self.rows, self.column_offset = 1, 1
         else:
-            if break_locations:
-                last_word = lines[-1][break_locations[-1] + 1:]
-                lines[-1] = lines[-1][:break_locations[-1]]
+            self.rows, self.column_offset = free_height // self.row_pitch + 1, 0
+
+    @property
+    def column_count(self) -> int:
+        return self.column_offset + math.ceil(self.count / self.rows) if self.count else 0
+
+    def index_range(self, first_column: int, end_column: int) -> Tuple[int, int]:
+        """Returns the range of shortcut indices in the columns from first_column up to (but not including)
+        end_column."""
+        start = max(first_column - self.column_offset, 0) * self.rows
+        end = max(end_column - self.column_offset, 0) * self.rows
+        return min(start, self.count), min(end, self.count)
+
+    def cell_origin(self, index: int) -> Tuple[int, int]:
+        column, row = divmod(index, self.rows)
+        return (self.margin + (column + self.column_offset) * self.column_pitch,
+                self.margin + row * self.row_pitch)
+
+    def cell_box(self, index: int) -> Tuple[int, int, int, int]:
+        x, y = self.cell_origin(index)
+        return x, y, x + self.cell_width, y + self.cell_height
+
+    def index_at(self, x: Union[int, float], y: Union[int, float]) -> Optional[int]:
+        """Returns the index of the shortcut whose cell contains the given point, or None if the point is on a margin
+        or an empty cell."""
+        if self.column_pitch <= 0 or self.row_pitch <= 0:
+            return None
+        column, column_x = divmod(x - self.margin, self.column_pitch)
+        row, row_y = divmod(y - self.margin, self.row_pitch)
+        if column < 0 or row < 0 or column_x > self.cell_width or row_y > self.cell_height:
+            return None
+        column, row = int(column) - self.column_offset, int(row)
+        candidates = [(column, row)]
+        if self.margin == 0:
+            # Without margins, a point on the shared edge of two cells belongs to both, and the one with the lowest
+            # index wins, as it is the first one whose rectangle contains the point.
+            candidates.extend((c, r) for c in (column, column - 1) for r in (row, row - 1)
+                              if (c, r) != (column, row) and (c == column or column_x == 0)
+                              and (r == row or row_y == 0))
+        indices = [column * self.rows + row for column, row in candidates
+                   if 0 <= column and 0 <= row < self.rows and column * self.rows + row < self.count]
+        return min(indices, default=None)
+
+
+class TextLayout:
+    """Word wrapping engine that keeps a per-font cache of glyph widths and advances line widths incrementally, instead
+    of measuring the whole line again for every character. Wrapped results are memoized by label, width, font and
+    break string, so re-wrapping unchanged labels on a refresh costs a dictionary lookup."""
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self.glyph_widths: Dict[Hashable, Dict[str, int]] = {}
+        self.wrapped: "OrderedDict[Tuple[str, int, Hashable, str], Tuple[Tuple[str, ...], Tuple[int, ...]]]" = \
+            OrderedDict()
+        self.font_keys: Dict[str, Hashable] = {}
+
+    def font_key(self, font: tkinter.font.Font) -> Hashable:
+        """Returns the actual attributes of the font, so that fonts that look the same share their glyph widths. They
+        are looked up once per font, as fonts are never reconfigured in place (each size has its own shared font), and
+        asking Tk for them is a round-trip."""
+        font_key = self.font_keys.get(str(font))
+        if font_key is None:
+            font_key = self.font_keys[str(font)] = tuple(sorted(font.actual().items()))
+        return font_key
+
+    def wrap(self, string: str, width: int, font: tkinter.font.Font, br: str = "-") -> Tuple[List[str], List[int]]:
+        """Returns the lines of the wrapped string, and the width of each line in pixels. Lines are broken at the last
+        space that fits, or mid-word with a trailing break string if the word does not fit on a line by itself (the
+        break string is omitted after non-ASCII characters, as Chinese characters do not need a dash on
+        line-breaking)."""
+        font_key = self.font_key(font)
+        key = (string, width, font_key, br)
+        result = self.wrapped.get(key)
+        if result is not None:
+            self.wrapped.move_to_end(key)
+            return list(result[0]), list(result[1])
+        glyphs = self.glyph_widths.setdefault(font_key, {})
+
+        def glyph_width(glyph: str) -> int:
+            glyph_size = glyphs.get(glyph)
+            if glyph_size is None:
+                glyph_size = glyphs[glyph] = font.measure(glyph)
+            return glyph_size
+
+        br_width = glyph_width(br)
+        lines, widths, break_locations = [[]], [[]], []
+        line_width = 0
+        for char in string:
+            if char == " ":
+                break_locations.append(len(lines[-1]))
+                lines[-1].append(char)
+                widths[-1].append(glyph_width(char))
+                line_width += widths[-1][-1]
+                continue
+            elif char == "\n":
                 break_locations.clear()
-                lines.append(last_word)
+                lines.append([])
+                widths.append([])
+                line_width = 0
+                continue
+            char_width = glyph_width(char)
+            if line_width + char_width + br_width <= width:
                 lines[-1].append(char)
+                widths[-1].append(char_width)
+                line_width += char_width
             else:
-                if lines and lines[-1]:
-                    if lines[-1][-1].isascii():  # Chinese characters do not need a dash on line-breaking.
-                        lines[-1].append(br)
-                lines.append([char])
-    return ["".join(line) for line in lines]
+                if break_locations:
+                    last_word = lines[-1][break_locations[-1] + 1:]
+                    last_widths = widths[-1][break_locations[-1] + 1:]
+                    lines[-1] = lines[-1][:break_locations[-1]]
+                    widths[-1] = widths[-1][:break_locations[-1]]
+                    break_locations.clear()
+                    lines.append(last_word + [char])
+                    widths.append(last_widths + [char_width])
+                    line_width = sum(widths[-1])
+                else:
+                    if lines and lines[-1]:
+                        if lines[-1][-1].isascii():  # Chinese characters do not need a dash on line-breaking.
+                            lines[-1].append(br)
+                            widths[-1].append(br_width)
+                    lines.append([char])
+                    widths.append([char_width])
+                    line_width = char_width
+        result = (tuple("".join(line) for line in lines), tuple(sum(line) for line in widths))
+        self.wrapped[key] = result
+        if len(self.wrapped) > self.cache_size:
+            self.wrapped.popitem(last=False)
+        return list(result[0]), list(result[1])
+
+
+text_layout = TextLayout()
+
+
+def word_wrap_text(string: str, width: int, font: tkinter.font.Font, br: str = "-") -> List[str]:
+    return text_layout.wrap(string, width, font, br)[0]
+
+
+class MainThreadQueue:
+    """Hands callbacks from worker threads over to the Tk thread. With a thread-enabled Tcl, tkinter forwards calls made
+    from other threads to the interpreter's thread, so the queue is drained as soon as something is posted; otherwise
+    the Tk thread has to poll it."""
+    def __init__(self, root: tkinter.Tk, poll_interval: int = 250):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.callbacks = queue.Queue()
+        self.threaded = bool(int(root.tk.eval("info exists tcl_platform(threaded)")))
+        if not self.threaded:
+            self.poll()
+
+    def post(self, callback: Callable[[], None]) -> None:
+        """May be called from any thread."""
+        self.callbacks.put(callback)
+        if self.threaded:
+            with suppress(RuntimeError, tkinter.TclError):  # The main loop has already exited.
+                self.root.after(0, self.drain)
+
+    def drain(self) -> None:
+        while True:
+            try:
+                callback = self.callbacks.get_nowait()
+            except queue.Empty:
+                break
+            callback()
+
+    def poll(self) -> None:
+        self.drain()
+        self.root.after(self.poll_interval, self.poll)
 
 
 def configure_dpi() -> None:
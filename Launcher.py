@@ -0,0 +1,116 @@
+from contextlib import suppress
+from typing import *
+import hashlib
+import os
+import queue
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+# Characters that only a shell can make sense of. Commands containing any of them are run through the shell, while
+# plain "program arg arg" commands are executed directly.
+shell_syntax = re.compile(r"[|&;<>()$`*?\[\]#~=%!{}^\n]")
+
+
+def build_command(command: str) -> Tuple[Union[str, List[str]], bool]:
+    """Returns the arguments to pass to Popen for the given command, and whether it needs to be run through the
+    shell."""
+    if shell_syntax.search(command):
+        return command, True
+    try:
+        argv = shlex.split(command, posix=os.name != "nt")
+    except ValueError:
+        return command, True
+    if not argv or shutil.which(argv[0].strip('"')) is None:
+        return command, True  # Probably a shell builtin (eg. echo on Windows), alias or function.
+    return (command if os.name == "nt" else argv), False
+
+
+class Launcher:
+    """Runs shortcut commands from a background thread, so that the Tk thread never waits on a process being spawned.
+    The output of each shortcut goes to its own rotating log file, finished children are reaped, and the number of
+    instances of a shortcut that may run at the same time is limited."""
+    def __init__(self, log_dir: str, error_callback: Callable[[str], None], max_instances: int = 4,
+                 log_size_limit: int = 1024 ** 2, log_backups: int = 3):
+        self.log_dir = log_dir
+        self.error_callback = error_callback
+        self.max_instances = max_instances
+        self.log_size_limit = log_size_limit
+        self.log_backups = log_backups
+        self.reap_interval = 0.5
+        self.requests = queue.Queue()
+        self.running: Dict[str, List[subprocess.Popen]] = {}
+        self.thread = threading.Thread(target=self.run, name="launcher", daemon=True)
+        self.thread.start()
+
+    def launch(self, name: str, command: str, max_instances: Optional[int] = None) -> None:
+        """Queues the command of the shortcut with the given name to be run. Desktops with their own limit on the number
+        of instances pass it, instead of using the launcher's. May be called from any thread."""
+        self.requests.put((name, command, self.max_instances if max_instances is None else max_instances))
+
+    def run(self) -> None:
+        while True:
+            try:
+                # Only wake up periodically while there are children left to reap.
+                name, command, max_instances = self.requests.get(timeout=self.reap_interval if self.running else None)
+            except queue.Empty:
+                pass
+            else:
+                self.reap()
+                self.spawn(name, command, max_instances)
+            self.reap()
+
+    def reap(self) -> None:
+        for key in list(self.running):
+            self.running[key] = [process for process in self.running[key] if process.poll() is None]
+            if not self.running[key]:
+                del self.running[key]
+
+    def log_path(self, name: str, command: str) -> str:
+        safe_name = re.sub(r"[^\w.-]+", "_", name).strip("_")[:40] or "shortcut"
+        return os.path.join(self.log_dir, "{}-{}.log".format(safe_name,
+                                                             hashlib.sha1(command.encode("utf-8")).hexdigest()[:8]))
+
+    def rotate_log(self, path: str) -> None:
+        with suppress(OSError):
+            if os.path.getsize(path) < self.log_size_limit:
+                return
+            for index in range(self.log_backups - 1, 0, -1):
+                if os.path.isfile("{}.{}".format(path, index)):
+                    os.replace("{}.{}".format(path, index), "{}.{}".format(path, index + 1))
+            os.replace(path, "{}.1".format(path))
+
+    def spawn(self, name: str, command: str, max_instances: int) -> None:
+        key = "{}\0{}".format(name, command)
+        path = self.log_path(name, command)
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.rotate_log(path)
+            log_file = open(path, "ab")
+        except OSError:
+            log_file = None  # Without a log file, output is discarded rather than sent to the parent's terminal.
+        try:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            if len(self.running.get(key, ())) >= max_instances:
+                if log_file is not None:
+                    log_file.write("[{}] Not started, {} instance(s) already running: {}\n"
+                                   .format(timestamp, max_instances, command).encode("utf-8"))
+                return
+            if log_file is not None:
+                log_file.write("[{}] Starting: {}\n".format(timestamp, command).encode("utf-8"))
+                log_file.flush()
+            args, shell = build_command(command)
+            output = log_file if log_file is not None else subprocess.DEVNULL
+            try:
+                process = subprocess.Popen(args, shell=shell, stdin=subprocess.DEVNULL, stdout=output,
+                                           stderr=subprocess.STDOUT)
+            except OSError as e:
+                self.error_callback("Failed to execute command. The command failed with the below message:\n{}"
+                                    .format(e))
+            else:
+                self.running.setdefault(key, []).append(process)
+        finally:
+            if log_file is not None:
+                log_file.close()  # The child has its own copy of the file descriptor.
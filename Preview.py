@@ -0,0 +1,69 @@
+from contextlib import suppress
+from typing import *
+import Config
+import json
+import os
+import tkinter
+# Bumped whenever the layout of the metadata changes.
+format_version = 2
+
+
+def source_signature(path: str) -> Optional[List[Union[str, int]]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [path, stat.st_mtime_ns, stat.st_size]
+
+
+def read_metadata(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            metadata = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return metadata if isinstance(metadata, dict) and metadata.get("format") == format_version else None
+
+
+def write_metadata(path: str, metadata: Dict[str, Any]) -> bool:
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(temp_path, path)
+    except OSError:
+        with suppress(OSError):
+            os.remove(temp_path)
+        return False
+    else:
+        return True
+
+
+class Preview(tkinter.Canvas):
+    """Shows the desktop as it looked when it was last fully loaded: a single flattened image of the wallpaper and the
+    icons, with the labels drawn on top. It only needs tkinter, so that it can be put on screen before Pillow has even
+    been imported, and is replaced by the real desktop once that has been built."""
+    def __init__(self, parent: tkinter.Toplevel, image: tkinter.PhotoImage, metadata: Dict[str, Any]):
+        super().__init__(parent, background="black", borderwidth=0, highlightthickness=0)
+        self.image = image
+        self.metadata = metadata
+        self.resolution: Tuple[int, int] = tuple(metadata["resolution"])
+        self.position: Tuple[int, int] = tuple(metadata["position"])
+        self.create_image(0, 0, image=image, anchor="nw")
+        font = ("Arial", metadata["font_size"])
+        for x, y, text in metadata["labels"]:
+            self.create_text(x, y, text=text, anchor="nw", font=font, fill="white")
+
+
+def load(parent: tkinter.Toplevel, config: Config.Storage) -> Optional[Preview]:
+    """Returns the preview saved by a previous run, or None if there is none or it was made from a different config,
+    wallpaper or icons. The config must have been loaded already."""
+    metadata = read_metadata(config.preview_path)
+    try:
+        if metadata is None or metadata["config_hash"] != config.content_hash \
+                or any(source_signature(source[0]) != source for source in metadata["sources"]):
+            return None
+        image = tkinter.PhotoImage(master=parent, file=config.preview_image_path)
+        return Preview(parent, image, metadata)
+    except (KeyError, TypeError, ValueError, tkinter.TclError):
+        return None
@@ -0,0 +1,143 @@
+from contextlib import nullcontext
+from typing import *
+import functools
+import json
+import os
+import threading
+import time
+environment_variable = "DESKTOP_SHORTCUTS_PROFILE"
+
+
+class Histogram:
+    """Latency histogram with power-of-two microsecond buckets, so that recording a sample is O(1) and the memory used
+    does not grow with the number of samples."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        bucket = int(seconds * 1000000).bit_length()  # Bucket n holds samples below 2 ** n microseconds.
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the upper bound of the bucket that contains the given percentile, in seconds."""
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2 ** bucket / 1000000, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean_s": self.total / self.count if self.count else 0.0, "max_s": self.maximum,
+                "p50_s": self.percentile(0.5), "p95_s": self.percentile(0.95), "p99_s": self.percentile(0.99),
+                "buckets_us": {str(2 ** bucket): count for bucket, count in sorted(self.buckets.items())}}
+
+
+class Span:
+    def __init__(self, recorder: "Recorder", name: str):
+        self.recorder = recorder
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.recorder.add_span(self.name, self.start, time.perf_counter())
+
+
+class Recorder:
+    """Records timed spans of the startup and refresh phases, latency histograms of event handlers, and counters.
+    Recording is turned on by the <profiling> setting or the DESKTOP_SHORTCUTS_PROFILE environment variable. Until the
+    settings have been loaded everything is recorded, so that the phases before that are not lost; once configure() has
+    turned recording off, spans and handlers cost a single attribute check."""
+    def __init__(self):
+        self.forced = os.environ.get(environment_variable, "") not in ("", "0")
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.phase = "startup"
+        self.spans: List[Dict[str, Any]] = []
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.lock = threading.Lock()  # Spans are also recorded from worker threads.
+        self.null_span = nullcontext()
+
+    def configure(self, enabled: bool) -> None:
+        self.enabled = enabled or self.forced
+        if not self.enabled:
+            self.spans.clear()
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def span(self, name: str) -> ContextManager:
+        """Returns a context manager that records how long its body took."""
+        return Span(self, name) if self.enabled else self.null_span
+
+    def add_span(self, name: str, start: float, end: float) -> None:
+        if self.enabled:
+            with self.lock:
+                self.spans.append({"phase": self.phase, "name": name, "start_s": start - self.origin,
+                                   "duration_s": end - start})
+
+    def mark(self, name: str) -> None:
+        """Records a span from the start of the process up to now."""
+        self.add_span(name, self.origin, time.perf_counter())
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, value: float) -> None:
+        """Records the current value of something, replacing the previous value."""
+        if self.enabled:
+            self.gauges[name] = value
+
+    def handler(self, name: str, function: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps an event handler so that its latency is added to the histogram with the given name."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> Any:
+            if not self.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start)
+        return wrapper
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Adds a sample to the histogram with the given name."""
+        if self.enabled:
+            with self.lock:
+                self.histograms.setdefault(name, Histogram()).add(seconds)
+
+    def dump(self, path: str) -> bool:
+        """Writes everything recorded so far to the given JSON file. A bool is returned to indicate if the file was
+        written."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            report = {"pid": os.getpid(), "uptime_s": time.perf_counter() - self.origin, "spans": list(self.spans),
+                      "handlers": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                      "counters": dict(self.counters), "gauges": dict(self.gauges)}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+        except OSError:
+            return False
+        else:
+            return True
+
+
+recorder = Recorder()
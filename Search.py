@@ -0,0 +1,60 @@
+from typing import *
+import Config
+
+
+class SearchIndex:
+    """Index of the labels and commands of the shortcuts, for type-to-filter search. Every substring of up to three
+    characters maps to the set of shortcuts that contain it, so that a query only has to intersect a few sets instead of
+    scanning every shortcut. Queries of more than three characters are narrowed down with their trigrams and then
+    checked against the text itself."""
+    gram_length = 3
+
+    def __init__(self, shortcuts: Tuple[Config.Shortcut, ...]):
+        self.shortcuts = shortcuts
+        self.labels = [shortcut.label_text.casefold() for shortcut in shortcuts]
+        # The words of each label with a space in front of each, so that word prefixes can be found with a single "in".
+        self.words = [" " + " ".join(label.split()) for label in self.labels]
+        # The fields are joined with a newline, which a search term can never contain, so no term matches across them.
+        self.texts = ["{}\n{}".format(label, (shortcut.command or "").casefold())
+                      for label, shortcut in zip(self.labels, shortcuts)]
+        self.grams: Dict[str, Set[int]] = {}
+        for index, text in enumerate(self.texts):
+            grams = set()
+            for length in range(1, self.gram_length + 1):
+                grams.update(text[start:start + length] for start in range(len(text) - length + 1))
+            grams.discard("\n")
+            for gram in grams:
+                self.grams.setdefault(gram, set()).add(index)
+
+    def candidates(self, term: str) -> Set[int]:
+        if len(term) <= self.gram_length:
+            return self.grams.get(term, set())
+        postings = sorted((self.grams.get(term[start:start + self.gram_length], set())
+                           for start in range(len(term) - self.gram_length + 1)), key=len)
+        return set.intersection(*postings)
+
+    def search(self, query: str) -> List[int]:
+        """Returns the indices of the shortcuts whose label or command contains every whitespace separated term of the
+        query, in any order. Shortcuts whose label starts with the query come first, then the ones with a word in the
+        label that starts with the first term, then the ones that match on the label alone, and then the rest, each in
+        the order of the config file."""
+        terms = query.casefold().split()
+        if not terms:
+            return list(range(len(self.shortcuts)))
+        postings = sorted((self.candidates(term) for term in terms), key=len)
+        matches = postings[0].intersection(*postings[1:])
+        long_terms = [term for term in terms if len(term) > self.gram_length]
+        if long_terms:
+            matches = [index for index in matches if all(term in self.texts[index] for term in long_terms)]
+        prefix = " ".join(terms)
+        word_prefix = " " + terms[0]
+        count = len(self.shortcuts)
+
+        def rank(index: int) -> int:
+            label = self.labels[index]
+            if label.startswith(prefix):
+                return index
+            if word_prefix in self.words[index]:
+                return count + index
+            return (2 if all(term in label for term in terms) else 3) * count + index
+        return sorted(matches, key=rank)
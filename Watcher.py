@@ -0,0 +1,135 @@
+from contextlib import suppress
+from typing import *
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+# Constants and event layout from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+inotify_event = struct.Struct("iIII")
+
+
+def load_inotify() -> Optional[ctypes.CDLL]:
+    """Returns the C library if it provides inotify (Linux only), or None otherwise."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") and hasattr(libc, "inotify_add_watch") else None
+
+
+class FileWatcher:
+    """Watches a single file on a background thread, and calls the given callback (on that thread) once a burst of
+    changes to the file has settled down. inotify is used when available, so that an idle watcher never wakes up;
+    otherwise the file's mtime, size and inode are polled."""
+    def __init__(self, path: str, callback: Callable[[], None], debounce: float = 0.3, poll_interval: float = 1.0):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.wake_pipe: Optional[Tuple[int, int]] = None
+        self.thread = threading.Thread(target=self.run, name="config-watcher", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.wake_pipe is not None:
+            with suppress(OSError):
+                os.write(self.wake_pipe[1], b"\0")
+
+    def run(self) -> None:
+        libc = load_inotify()
+        if libc is None or not self.watch_inotify(libc):
+            self.watch_polling()
+
+    def watch_inotify(self, libc: ctypes.CDLL) -> bool:
+        """Watches the file's directory rather than the file itself, as many editors save by replacing the file. A bool
+        is returned to indicate if inotify could be set up; if not, the caller should fall back to polling."""
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(os.path.dirname(self.path)), mask) < 0:
+            os.close(fd)
+            return False
+        self.wake_pipe = os.pipe()
+        name = os.fsencode(os.path.basename(self.path))
+        try:
+            while not self.stop_event.is_set():
+                # Block until something happens, then keep draining events until the directory has been quiet for the
+                # debounce period, so that one burst of saves results in one callback.
+                timeout = None
+                changed = False
+                while True:
+                    readable = select.select([fd, self.wake_pipe[0]], [], [], timeout)[0]
+                    if self.stop_event.is_set():
+                        return True
+                    if not readable:
+                        break
+                    if self.read_events(fd, name):
+                        changed = True
+                    if changed:
+                        timeout = self.debounce
+                if changed:
+                    self.callback()
+        finally:
+            os.close(fd)
+            for pipe_fd in self.wake_pipe:
+                os.close(pipe_fd)
+        return True
+
+    @staticmethod
+    def read_events(fd: int, name: bytes) -> bool:
+        """Reads all pending inotify events, and returns whether any of them concern the watched file."""
+        matched = False
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except BlockingIOError:
+                return matched
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = inotify_event.unpack_from(data, offset)
+                offset += inotify_event.size
+                if data[offset:offset + length].rstrip(b"\0") == name:
+                    matched = True
+                offset += length
+
+    def signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def watch_polling(self) -> None:
+        last_signature = self.signature()
+        while not self.stop_event.wait(self.poll_interval):
+            signature = self.signature()
+            if signature == last_signature:
+                continue
+            # Wait for the file to stop changing before reporting it.
+            while not self.stop_event.wait(self.debounce):
+                last_signature, signature = signature, self.signature()
+                if signature == last_signature:
+                    break
+            if self.stop_event.is_set():
+                return
+            last_signature = signature
+            self.callback()
@@ -1,37 +1,187 @@
+from contextlib import suppress
 from typing import *
-import Frames
+import Config
+import Global
+import Preview
+import Profiler
+import json
+import os
 import tkinter
+if TYPE_CHECKING:
+    import Frames
 
 
-class MainWindow(tkinter.Tk):
-    def __init__(self, script_path: str):
-        super().__init__()
+class Application(tkinter.Tk):
+    """The hidden root window of the process, hosting one desktop window per config file. The desktops share the Tk
+    interpreter, and once the first of them is built, the icon and wallpaper caches, decoding threads, fonts and
+    launcher in Frames.Services."""
+    def __init__(self, script_path: str, config_paths: List[Optional[str]]):
+        with Profiler.recorder.span("tk_init"):
+            super().__init__()
+        self.withdraw()
+        self.script_path = script_path
+        self.main_thread = Global.MainThreadQueue(self)
+        self.services: Optional["Frames.Services"] = None
+        self.windows: List[MainWindow] = []
+        for config_path in config_paths:
+            self.windows.append(MainWindow(self, config_path))
+        self.after_idle(Profiler.recorder.mark, "first_idle")
+        self.mainloop()
+
+    def create_desktop(self, window: "MainWindow") -> "Frames.Desktop":
+        import Frames  # Not imported at the top, as it pulls in Pillow, which is not needed for the preview.
+        if self.services is None:
+            self.services = Frames.Services(self, window.config)
+        return Frames.Desktop(window, window.config, self.services)
+
+    def desktops(self) -> List["Frames.Desktop"]:
+        return [window.content_frame for window in self.windows if window.content_frame is not None]
+
+    def close(self) -> None:
+        for desktop in self.desktops():
+            desktop.shut_down()
+        if self.services is not None:
+            self.services.shut_down()
+        self.destroy()
+
+
+class MainWindow(tkinter.Toplevel):
+    def __init__(self, app: Application, config_path: Optional[str] = None):
+        super().__init__(app)
+        self.app = app
         self.resolution = (0, 0)
+        self.position = (0, 0)
         self.geometry_string = ""
-        self.offset_x, self.offset_y = self.get_offset()
-        self.content_frame = None
+        self.lock_job: Optional[str] = None
+        self.lock_fallback_interval = 2000
+        self.lock_corrections = 0  # How many times the window actually had to be restored.
+        self.offset_checks = 0
+        self.config = Config.Storage(app.script_path, config_path)
+        with Profiler.recorder.span("get_offset"):
+            self.offset_x, self.offset_y = self.load_offset()
+        self.content_frame: Optional["Frames.Desktop"] = None
+        self.desktop_shown = False
         self.title("Desktop")
         self.resizable(False, False)
         self.protocol("WM_DELETE_WINDOW", lambda: None)
-        self.content_frame = Frames.Desktop(self, script_path)
-        self.content_frame.pack(expand=True, fill="both")
+        with Profiler.recorder.span("preview"):
+            self.config.init_xml_data()  # Errors are reported by the desktop.
+            self.preview = Preview.load(self, self.config)
+        if self.preview is None:
+            self.create_desktop()
+        else:
+            self.set_window_size(self.preview.resolution, self.preview.position)
+            self.preview.pack(expand=True, fill="both")
+            self.preview.bind("<Expose>", self.preview_painted)
+            self.after(1000, self.create_desktop)  # In case the preview is never exposed.
         self.lock_window()
-        self.mainloop()
+
+    def preview_painted(self, event: tkinter.Event) -> None:
+        if self.content_frame is None:
+            Profiler.recorder.mark("first_paint")
+            # The canvas redraws itself when idle. Waiting for that, and then for the event loop to flush the drawing to
+            # the screen, keeps the desktop from being built before the preview is actually visible.
+            self.after_idle(self.after, 1, self.create_desktop)
+
+    def create_desktop(self) -> None:
+        if self.content_frame is not None:
+            return
+        self.content_frame = self.app.create_desktop(self)
+        if self.preview is None:
+            self.show_desktop(self.content_frame)
+
+    def show_desktop(self, desktop: "Frames.Desktop") -> None:
+        """Puts the desktop on screen in place of the preview. Called once the desktop has been built and its icons have
+        been loaded, or right after it has been built if there is no preview."""
+        if self.desktop_shown:
+            return
+        self.desktop_shown = True
+        if self.preview is not None:
+            self.preview.destroy()
+            self.preview = None
+            Profiler.recorder.mark("preview_replaced")
+        desktop.pack(expand=True, fill="both")
 
     def get_offset(self) -> Tuple[int, int]:
         self.geometry("10x10+0+0")
         self.update()
         return -self.winfo_rootx(), -self.winfo_rooty()
 
-    def set_window_size(self, size: Tuple[int, int]) -> None:
+    def load_offset(self) -> Tuple[int, int]:
+        """Returns the offset measured by a previous run, so that the window does not have to be shown and waited for
+        just to measure it again. The cached offset is checked once the window is on screen."""
+        try:
+            with open(self.config.window_path, "r", encoding="utf-8") as file:
+                offset_x, offset_y = json.load(file)["offset"]
+            offset = int(offset_x), int(offset_y)
+        except (OSError, ValueError, KeyError, TypeError):
+            offset = self.get_offset()
+            self.save_offset(offset)
+            return offset
+        self.after_idle(self.verify_offset)
+        return offset
+
+    def save_offset(self, offset: Tuple[int, int]) -> None:
+        with suppress(OSError):
+            os.makedirs(os.path.dirname(self.config.window_path), exist_ok=True)
+            with open(self.config.window_path, "w", encoding="utf-8") as file:
+                json.dump({"offset": list(offset)}, file)
+
+    def verify_offset(self) -> None:
+        """Once the window has been placed at its geometry, its content should start exactly at its position on the
+        screen. If it does not, the window decorations have changed since the offset was cached."""
+        if not self.winfo_ismapped() or not self.geometry_string or self.geometry() != self.geometry_string:
+            self.offset_checks += 1
+            if self.offset_checks < 50:
+                self.after(100, self.verify_offset)
+            return
+        error_x, error_y = self.winfo_rootx() - self.position[0], self.winfo_rooty() - self.position[1]
+        if (error_x, error_y) != (0, 0):
+            self.offset_x -= error_x
+            self.offset_y -= error_y
+            self.save_offset((self.offset_x, self.offset_y))
+            self.set_window_size(self.resolution, self.position)
+
+    def set_window_size(self, size: Tuple[int, int], position: Tuple[int, int] = (0, 0)) -> None:
+        """Sets the size of the window's content, and the position of its top left corner on the screen."""
         self.resolution = size
-        self.geometry_string = "{}x{}+{}+{}".format(size[0], size[1], self.offset_x, self.offset_y)
+        self.position = position
+        self.geometry_string = "{}x{}+{}+{}".format(size[0], size[1], self.offset_x + position[0],
+                                                     self.offset_y + position[1])
+        self.schedule_lock_check()
 
     def lock_window(self) -> None:
+        """Keeps the window mapped and pinned at its geometry. Checks are made when the window is moved, resized,
+        unmapped or mapped, plus a slow periodic check in case the window manager changes the window without sending
+        an event."""
+        for sequence in ("<Configure>", "<Unmap>", "<Map>"):
+            self.bind(sequence, self.window_changed, add="+")
+        self.schedule_lock_check()
+        self.after(self.lock_fallback_interval, self.fallback_lock_check)
+
+    def window_changed(self, event: tkinter.Event) -> None:
+        if event.widget is self:  # Events of child widgets also reach the bindings of their toplevel.
+            self.schedule_lock_check()
+
+    def schedule_lock_check(self) -> None:
+        if self.lock_job is None:
+            self.lock_job = self.after_idle(self.check_lock)
+
+    def fallback_lock_check(self) -> None:
+        self.schedule_lock_check()
+        self.after(self.lock_fallback_interval, self.fallback_lock_check)
+
+    def check_lock(self) -> None:
+        self.lock_job = None
+        corrected = False
         if self.state() != "normal" or not self.winfo_ismapped():
             self.deiconify()
             self.attributes("-topmost", True)
             self.attributes("-topmost", False)
+            corrected = True
         if self.geometry() != self.geometry_string:
             self.geometry(self.geometry_string)
-        self.after(50, self.lock_window)
+            corrected = True
+        if corrected:
+            self.lock_corrections += 1
+            Profiler.recorder.count("window.lock_corrections")
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 import Window
 import Global
+import argparse
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows a virtual desktop for each of the given config files.")
+    parser.add_argument("config_paths", nargs="*", metavar="CONFIG",
+                        help="config file of a desktop (default: ~/.desktop_shortcuts/userconfig.xml)")
+    args = parser.parse_args()
     Global.configure_dpi()
-    Window.MainWindow(__file__)
+    Window.Application(__file__, args.config_paths or [None])